@@ -1,13 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from pymongo import MongoClient, errors
 from datetime import datetime
+import json
 import os
 from dotenv import load_dotenv
 from functools import wraps
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pymongo.errors import AutoReconnect
 import certifi
+from vin_cache import VINCache
+from mongo_health import CircuitBreaker, DatabaseUnavailable, MongoHealthMonitor
+from vin_index import VINIndex
+from db_schema import ensure_indexes
+from storage import MongoVINStore, SQLiteVINStore
+import metrics
+from vin_payloads import (
+    NDJSON_MIMETYPES, PayloadTooLarge, bulk_batch_results, bulk_records_from_json, check_body_size,
+    collect_vins, lookup_result, merge_bulk_records, parse_ndjson_lines
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +33,64 @@ app = Flask(__name__)
 MONGO_URI = os.getenv('MONGO_URI')
 API_KEY = os.getenv('API_KEY')
 
+# Atlas requires TLS; MONGO_TLS=false allows a local mongod (e.g. for bench_api.py)
+MONGO_TLS_OPTIONS = (
+    {'tlsCAFile': certifi.where()}
+    if os.getenv('MONGO_TLS', 'true').lower() in ('1', 'true', 'yes') else {}
+)
+
+# Upper bound on VINs accepted by a single batch lookup
+MAX_BATCH_VINS = int(os.getenv('MAX_BATCH_VINS', '500'))
+
+# Number of upserts sent per bulk_write call by /api/add_vins
+BULK_WRITE_BATCH_SIZE = int(os.getenv('BULK_WRITE_BATCH_SIZE', '1000'))
+
+# Upper bounds on one /api/add_vins request; larger requests get a 413
+MAX_BULK_RECORDS = int(os.getenv('MAX_BULK_RECORDS', '100000'))
+MAX_BULK_BYTES = int(os.getenv('MAX_BULK_BYTES', str(16 * 1024 * 1024)))
+
+# In-process lookup cache; VIN_CACHE_SIZE=0 disables it
+vin_cache = VINCache(
+    max_size=int(os.getenv('VIN_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('VIN_CACHE_TTL', '300')),
+    miss_ttl=float(os.getenv('VIN_CACHE_MISS_TTL', '30'))
+)
+
+# Shared MongoDB health state, fed by the driver's heartbeats and by request outcomes
+mongo_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv('MONGO_BREAKER_FAILURES', '3')),
+    reset_timeout=float(os.getenv('MONGO_BREAKER_RESET_SECONDS', '10'))
+)
+mongo_monitor = MongoHealthMonitor(mongo_breaker)
+
+def mongo_pool_options():
+    """maxPoolSize/minPoolSize/waitQueueTimeoutMS for this process
+
+    Under gunicorn.conf.py, GUNICORN_THREADS is the number of request threads
+    per sync/gthread worker: the pool allows one connection per thread plus
+    one for the index refresher, and keeps one per thread open so a burst
+    doesn't wait on TLS handshakes. gevent/eventlet workers don't set it.
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE and
+    MONGO_WAIT_QUEUE_TIMEOUT_MS override the derived values; with none of
+    them set the driver defaults apply.
+    """
+    options = {}
+    threads = os.getenv('GUNICORN_THREADS')
+    if threads:
+        options = {'maxPoolSize': int(threads) + 1, 'minPoolSize': int(threads), 'waitQueueTimeoutMS': 2000}
+    for option, name in (('maxPoolSize', 'MONGO_MAX_POOL_SIZE'),
+                         ('minPoolSize', 'MONGO_MIN_POOL_SIZE'),
+                         ('waitQueueTimeoutMS', 'MONGO_WAIT_QUEUE_TIMEOUT_MS')):
+        if os.getenv(name):
+            options[option] = int(os.getenv(name))
+    return options
+
+MONGO_POOL_OPTIONS = mongo_pool_options()
+
+# gunicorn.conf.py sets this with preload_app: background threads and
+# connections are then started per worker by init_worker() after the fork
+INIT_AFTER_FORK = os.getenv('APP_INIT_AFTER_FORK', '').lower() in ('1', 'true', 'yes')
+
 # Global MongoDB client with connection pooling
 _mongo_client = None
 
@@ -35,11 +105,22 @@ def get_mongo_client():
                 serverSelectionTimeoutMS=5000,
                 connectTimeoutMS=5000,
                 socketTimeoutMS=5000,
-                tlsCAFile=certifi.where()
+                heartbeatFrequencyMS=int(os.getenv('MONGO_HEARTBEAT_MS', '10000')),
+                event_listeners=[mongo_monitor, metrics.command_listener, metrics.pool_listener],
+                **MONGO_POOL_OPTIONS,
+                **MONGO_TLS_OPTIONS
             )
             
-            # Test connection immediately
+            # Test connection once at creation; afterwards the heartbeat monitor tracks health
             _mongo_client.admin.command('ping')
+
+            # Make sure lookups and upserts are index-backed (no-op once the indexes exist)
+            if os.getenv('MONGO_ENSURE_INDEXES', 'true').lower() in ('1', 'true', 'yes'):
+                try:
+                    ensure_indexes(_mongo_client.vin_database)
+                except errors.OperationFailure as index_error:
+                    # e.g. duplicate VINs blocking the unique index; serve anyway but shout
+                    logger.error(f"Failed to ensure vin_records indexes: {str(index_error)}")
             
             # Log topology information safely
             try:
@@ -57,40 +138,98 @@ def get_mongo_client():
                 
         except Exception as e:
             logger.error(f"Failed to create MongoDB client: {str(e)}")
+            if _mongo_client is not None:
+                # Stop its monitor threads so stale heartbeats don't feed the breaker
+                _mongo_client.close()
             _mongo_client = None
             raise
     return _mongo_client
 
+def warm_mongo_pool():
+    """Create the client and open minPoolSize connections before the first request
+
+    Concurrent pings each check out a connection, so the pool holds that
+    many established connections when they return.
+    """
+    client = get_mongo_client()
+    size = MONGO_POOL_OPTIONS.get('minPoolSize') or 1
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=size) as executor:
+        list(executor.map(lambda _: client.admin.command('ping'), range(size)))
+    logger.info(f"Warmed MongoDB pool with {size} connections in {time.perf_counter() - started:.2f}s")
+
 def retry_with_backoff(func, max_retries=3):
-    """Retry function with exponential backoff"""
+    """Retry function with exponential backoff, failing fast while the circuit breaker is open"""
     for attempt in range(max_retries):
+        if not mongo_breaker.allow_request():
+            raise DatabaseUnavailable("MongoDB is unavailable (circuit breaker open)")
         try:
-            return func()
+            result = func()
         except (errors.ServerSelectionTimeoutError, 
                 errors.ConnectionFailure,
                 errors.NetworkTimeout,
                 AutoReconnect) as e:
-            if attempt == max_retries - 1:
+            mongo_breaker.record_failure(e)
+            if attempt == max_retries - 1 or mongo_breaker.state != CircuitBreaker.CLOSED:
                 logger.error(f"Final retry attempt failed: {str(e)}")
                 raise
             wait_time = (2 ** attempt) * 0.1  # 0.1s, 0.2s, 0.4s
             logger.warning(f"Retry attempt {attempt + 1}/{max_retries}. Waiting {wait_time}s")
+            metrics.registry.inc('mongodb_retries_total', (('error', type(e).__name__),))
             time.sleep(wait_time)
+        except Exception:
+            # MongoDB answered; the error is not about connectivity
+            mongo_breaker.record_success()
+            raise
+        else:
+            mongo_breaker.record_success()
+            return result
 
 def get_db():
-    try:
-        client = get_mongo_client()
-        # Test connection with retry
-        def test_connection():
-            client.admin.command('ping')
-            return client.vin_database
-        
-        db = retry_with_backoff(test_connection)
-        logger.info("Successfully connected to MongoDB")
-        return db
-    except Exception as e:
-        logger.error(f"Failed to connect to MongoDB: {type(e).__name__}: {str(e)}")
-        raise
+    """Return the VIN database; call inside retry_with_backoff so the circuit breaker sees the outcome"""
+    return get_mongo_client().vin_database
+
+# Request metrics; route labels use the URL rule so unknown paths don't add series
+@app.before_request
+def start_request_metrics():
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_started = time.perf_counter()
+    metrics.registry.add_gauge('http_requests_in_flight', (('route', g.metrics_route),), 1)
+
+@app.after_request
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    if 'metrics_started' not in g:
+        return
+    labels = (
+        ('route', g.metrics_route),
+        ('method', request.method),
+        ('status', str(g.get('metrics_status', 500)))
+    )
+    metrics.registry.add_gauge('http_requests_in_flight', (('route', g.metrics_route),), -1)
+    metrics.registry.inc('http_requests_total', labels)
+    metrics.registry.observe('http_request_duration_seconds', labels, time.perf_counter() - g.metrics_started)
+
+@app.errorhandler(DatabaseUnavailable)
+def handle_database_unavailable(e):
+    logger.warning(f"Rejecting request, {str(e)}")
+    return jsonify({
+        'error': 'Database connection error',
+        'message': 'Unable to connect to database',
+        'details': str(e)
+    }), 503, {'Retry-After': str(int(mongo_breaker.reset_timeout))}
+
+@app.errorhandler(PayloadTooLarge)
+def handle_payload_too_large(e):
+    logger.warning(f"Rejecting request, {str(e)}")
+    return jsonify({
+        'error': 'Payload too large',
+        'message': str(e)
+    }), 413
 
 @app.errorhandler(500)
 def handle_500(e):
@@ -100,6 +239,53 @@ def handle_500(e):
         'message': str(e)
     }), 500
 
+# Storage backend: 'mongo' (default) or 'sqlite' for a local vin_database.db
+VIN_STORAGE_BACKEND = os.getenv('VIN_STORAGE_BACKEND', 'mongo').lower()
+if VIN_STORAGE_BACKEND == 'sqlite':
+    vin_store = SQLiteVINStore(
+        os.getenv('SQLITE_PATH', 'vin_database.db'),
+        mmap_size=int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    )
+elif VIN_STORAGE_BACKEND == 'mongo':
+    vin_store = MongoVINStore(get_db, retry_with_backoff)
+else:
+    raise ValueError(f"Unknown VIN_STORAGE_BACKEND: {VIN_STORAGE_BACKEND}")
+logger.info(f"Using {vin_store.name} storage backend")
+
+# Optional Bloom-filter membership index that answers definite misses locally
+# (Mongo only; SQLite lookups are already local)
+vin_index = None
+if VIN_STORAGE_BACKEND == 'mongo' and os.getenv('VIN_INDEX_ENABLED', '').lower() in ('1', 'true', 'yes'):
+    vin_index = VINIndex(
+        lambda: get_db().vin_records,
+        error_rate=float(os.getenv('VIN_INDEX_ERROR_RATE', '0.001')),
+        refresh_interval=float(os.getenv('VIN_INDEX_REFRESH_SECONDS', '10')),
+        rebuild_interval=float(os.getenv('VIN_INDEX_REBUILD_SECONDS', '3600'))
+    )
+    if not INIT_AFTER_FORK:
+        vin_index.start()
+
+def init_worker():
+    """Per-worker setup after gunicorn forks from the preloaded app (see gunicorn.conf.py)
+
+    MongoClient and sqlite3 connections are not fork-safe, so anything
+    inherited from the master is dropped and this process builds its own.
+    The Mongo pool is warmed here, so the first request after a deploy or
+    scale-up does not pay for connection setup.
+    """
+    global _mongo_client
+    # Not closed: its sockets and monitor state belong to the parent
+    _mongo_client = None
+    vin_store.after_fork()
+    if VIN_STORAGE_BACKEND == 'mongo':
+        try:
+            warm_mongo_pool()
+        except Exception as e:
+            # Serve anyway; requests retry the connection and the breaker guards them
+            logger.error(f"Failed to warm MongoDB pool: {str(e)}")
+    if vin_index:
+        vin_index.start()
+
 def require_api_key(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -123,26 +309,32 @@ def check_vin():
             return jsonify({'error': 'No VIN provided'}), 400
             
         logger.info(f"Checking VIN: {vin}")
+
+        cached = vin_cache.get(vin)
+        if cached is not None:
+            logger.info(f"Cache hit for VIN: {vin}")
+            return jsonify(cached)
+
+        if vin_index and vin_index.definitely_missing(vin):
+            logger.info(f"VIN not in membership index: {vin}")
+            return jsonify({'found': False})
         
-        def query_vin():
-            db = get_db()
-            return db.vin_records.find_one(
-                {'vin_value': vin},
-                max_time_ms=5000
-            )
-        
-        # Use retry logic for the query
-        result = retry_with_backoff(query_vin)
+        version = vin_cache.version()
+        result = vin_store.find(vin)
         
+        response = lookup_result(result)
         if result:
             logger.info(f"Found VIN: {vin}")
-            return jsonify({
-                'found': True,
-                'description': result.get('description'),
-                'scan_date': result.get('scan_date')
-            })
-        logger.info(f"VIN not found: {vin}")
-        return jsonify({'found': False})
+        else:
+            logger.info(f"VIN not found: {vin}")
+            if vin_index and vin_index.ready:
+                vin_index.record_false_positive()
+
+        vin_cache.set(vin, response, since=version)
+        return jsonify(response)
+    except DatabaseUnavailable:
+        # Circuit breaker open: answer with Retry-After like the write routes
+        raise
     except Exception as e:
         logger.error(f"Error checking VIN: {str(e)}")
         return jsonify({
@@ -151,6 +343,65 @@ def check_vin():
             'details': str(e)
         }), 503
 
+@app.route('/api/check_vins', methods=['GET', 'POST'])
+@require_api_key
+def check_vins():
+    """Look up many VINs with a single query ($in on Mongo, IN on SQLite)"""
+    try:
+        vins = collect_vins(request.args.getlist('vin'), request.get_json(silent=True))
+        if not vins:
+            return jsonify({'error': 'No VINs provided'}), 400
+        if len(vins) > MAX_BATCH_VINS:
+            return jsonify({
+                'error': 'Too many VINs',
+                'message': f'At most {MAX_BATCH_VINS} VINs per request'
+            }), 400
+
+        logger.info(f"Checking {len(vins)} VINs in batch")
+
+        results = {}
+        uncached = []
+        for vin in vins:
+            cached = vin_cache.get(vin)
+            if cached is not None:
+                results[vin] = cached
+            elif vin_index and vin_index.definitely_missing(vin):
+                results[vin] = {'found': False}
+            else:
+                uncached.append(vin)
+
+        if uncached:
+            version = vin_cache.version()
+            records = vin_store.find_many(uncached)
+            found = {record['vin_value']: record for record in records}
+
+            for vin in uncached:
+                results[vin] = lookup_result(found.get(vin))
+                if not results[vin]['found']:
+                    if vin_index and vin_index.ready:
+                        vin_index.record_false_positive()
+                vin_cache.set(vin, results[vin], since=version)
+
+        # Preserve the caller's order in the response
+        results = {vin: results[vin] for vin in vins}
+        found_count = sum(1 for result in results.values() if result['found'])
+        logger.info(f"Batch lookup found {found_count} of {len(vins)} VINs ({len(vins) - len(uncached)} cached)")
+        return jsonify({
+            'results': results,
+            'found_count': found_count,
+            'not_found_count': len(vins) - found_count
+        })
+    except DatabaseUnavailable:
+        # Circuit breaker open: answer with Retry-After like the write routes
+        raise
+    except Exception as e:
+        logger.error(f"Error checking VINs: {str(e)}")
+        return jsonify({
+            'error': 'Database connection error',
+            'message': 'Unable to connect to database',
+            'details': str(e)
+        }), 503
+
 @app.route('/api/add_vin', methods=['POST'])
 @require_api_key
 def add_vin():
@@ -160,48 +411,177 @@ def add_vin():
             return jsonify({'error': 'No VIN provided'}), 400
             
         logger.info(f"Adding VIN: {data['vin_value']}")
-        db = get_db()
         
-        result = db.vin_records.update_one(
-            {'vin_value': data['vin_value']},
-            {
-                '$set': {
-                    'vin_value': data['vin_value'],
-                    'description': data.get('description', ''),
-                    'scan_date': datetime.utcnow()
-                }
-            },
-            upsert=True
-        )
+        scan_date = datetime.utcnow()
+
+        try:
+            result = vin_store.upsert(data['vin_value'], data.get('description', ''), scan_date)
+        except Exception:
+            # The write may or may not have landed; don't keep serving the old answer
+            vin_cache.invalidate(data['vin_value'])
+            raise
+
+        vin_cache.set(data['vin_value'], {
+            'found': True,
+            'description': data.get('description', ''),
+            'scan_date': scan_date
+        })
+        if vin_index:
+            vin_index.add(data['vin_value'])
         
         logger.info(f"Successfully added/updated VIN: {data['vin_value']}")
         return jsonify({
             'success': True,
-            'modified_count': result.modified_count,
-            'upserted_id': str(result.upserted_id) if result.upserted_id else None
+            'modified_count': result['modified_count'],
+            'upserted_id': result['upserted_id']
         })
     except Exception as e:
         logger.error(f"Error adding VIN: {str(e)}")
         raise
 
-@app.route('/')
-def health_check():
-    """Health check endpoint"""
+def read_bulk_records():
+    """Read records from a JSON array ({"records": [...]} also accepted) or an NDJSON body
+
+    At most MAX_BULK_BYTES of body and MAX_BULK_RECORDS records are read,
+    also for chunked bodies without a Content-Length.
+    """
+    check_body_size(request.content_length, MAX_BULK_BYTES)
+    body = request.stream.read(MAX_BULK_BYTES + 1)
+    if len(body) > MAX_BULK_BYTES:
+        raise PayloadTooLarge(f'Request body larger than {MAX_BULK_BYTES} bytes')
+    if request.mimetype in NDJSON_MIMETYPES:
+        return parse_ndjson_lines(body.splitlines(), MAX_BULK_RECORDS)
+    if not request.is_json:
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    return bulk_records_from_json(data, MAX_BULK_RECORDS)
+
+@app.route('/api/add_vins', methods=['POST'])
+@require_api_key
+def add_vins():
+    """Upsert many VINs in batches (unordered bulk_write on Mongo, one transaction per batch on SQLite)"""
     try:
-        # Get client and test connection
-        client = get_mongo_client()
-        client.admin.command('ping')
+        records = read_bulk_records()
+        if not records:
+            return jsonify({'error': 'No VINs provided'}), 400
+
+        batch_size = request.args.get('batch_size', BULK_WRITE_BATCH_SIZE, type=int)
+        if not batch_size or batch_size < 1:
+            return jsonify({'error': 'batch_size must be a positive integer'}), 400
+
+        merged, results, duplicates = merge_bulk_records(records)
+        logger.info(f"Bulk adding {len(merged)} VINs ({duplicates} duplicates merged)")
+
+        scan_date = datetime.utcnow()
+        upserted_count = 0
+        modified_count = 0
+
+        for start in range(0, len(merged), batch_size):
+            batch = merged[start:start + batch_size]
+            try:
+                details = vin_store.bulk_upsert(batch, scan_date)
+            except Exception:
+                for record in batch:
+                    vin_cache.invalidate(record['vin_value'])
+                raise
+
+            upserted_count += details.get('nUpserted', 0)
+            modified_count += details.get('nModified', 0)
+
+            batch_results = bulk_batch_results(batch, details)
+            for record, result in zip(batch, batch_results):
+                if result['status'] == 'error':
+                    vin_cache.invalidate(record['vin_value'])
+                    continue
+                vin_cache.set(record['vin_value'], {
+                    'found': True,
+                    'description': record['description'],
+                    'scan_date': scan_date
+                })
+                if vin_index:
+                    vin_index.add(record['vin_value'])
+            results.extend(batch_results)
+
+        error_count = sum(1 for item in results if item['status'] == 'error')
+        logger.info(f"Bulk add finished: {upserted_count} upserted, {modified_count} modified, {error_count} errors")
         return jsonify({
-            'status': 'healthy',
-            'message': 'Connected to MongoDB'
+            'success': error_count == 0,
+            'received': len(records),
+            'duplicates_merged': duplicates,
+            'upserted_count': upserted_count,
+            'modified_count': modified_count,
+            'error_count': error_count,
+            'results': results
         })
+    except PayloadTooLarge:
+        raise
+    except Exception as e:
+        logger.error(f"Error bulk adding VINs: {str(e)}")
+        raise
+
+@app.route('/api/cache_stats', methods=['GET'])
+@require_api_key
+def cache_stats():
+    """Hit/miss/eviction counters for the lookup cache"""
+    return jsonify(vin_cache.stats())
+
+@app.route('/api/index_stats', methods=['GET'])
+@require_api_key
+def index_stats():
+    """Memory use and false-positive rate of the membership index"""
+    if not vin_index:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **vin_index.stats()})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics for this worker process"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/')
+def health_check():
+    """Health check endpoint, reporting the shared health state instead of pinging"""
+    if VIN_STORAGE_BACKEND != 'mongo':
+        try:
+            return jsonify({
+                'status': 'healthy',
+                'message': f'Using {vin_store.name} storage',
+                'storage': vin_store.status()
+            })
+        except Exception as e:
+            logger.error(f"Health check failed: {str(e)}")
+            return jsonify({
+                'status': 'unhealthy',
+                'message': 'Database connection failed',
+                'error': str(e)
+            }), 500
+
+    try:
+        if _mongo_client is None:
+            # First request in this worker creates the client (its one-off ping)
+            retry_with_backoff(get_mongo_client, max_retries=1)
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
+
+    health = {
+        'circuit_breaker': mongo_breaker.status(),
+        'monitor': mongo_monitor.status()
+    }
+    if mongo_breaker.state == CircuitBreaker.OPEN or _mongo_client is None:
         return jsonify({
             'status': 'unhealthy',
             'message': 'Database connection failed',
-            'error': str(e)
+            'error': mongo_breaker.last_error,
+            **health
         }), 500
+    return jsonify({
+        'status': 'healthy',
+        'message': 'Connected to MongoDB',
+        **health
+    })
 
 if __name__ == "__main__":
     app.run(debug=True) 
\ No newline at end of file
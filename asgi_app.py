@@ -0,0 +1,504 @@
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from pymongo import AsyncMongoClient, errors
+from pymongo.errors import AutoReconnect
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from functools import wraps
+from dotenv import load_dotenv
+import asyncio
+import certifi
+import json
+import logging
+import os
+import time
+from vin_cache import VINCache
+from mongo_health import CircuitBreaker, DatabaseUnavailable, MongoHealthMonitor
+from db_schema import (
+    VIN_LOOKUP_PROJECTION, bulk_upsert_operations, ensure_indexes_async, lookup_filter, lookup_many_filter,
+    upsert_update
+)
+import metrics
+from vin_payloads import (
+    NDJSON_MIMETYPES, PayloadTooLarge, bulk_batch_results, bulk_records_from_json, check_body_size,
+    collect_vins, lookup_result, merge_bulk_records, parse_ndjson_lines
+)
+
+# Async (ASGI) variant of app.py: same URLs, auth header and JSON shapes,
+# served by uvicorn with PyMongo's async client, e.g.
+#   uvicorn asgi_app:app --host 0.0.0.0 --port $PORT --workers 4
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# MongoDB connection
+MONGO_URI = os.getenv('MONGO_URI')
+API_KEY = os.getenv('API_KEY')
+
+# Atlas requires TLS; MONGO_TLS=false allows a local mongod (e.g. for bench_api.py)
+MONGO_TLS_OPTIONS = (
+    {'tlsCAFile': certifi.where()}
+    if os.getenv('MONGO_TLS', 'true').lower() in ('1', 'true', 'yes') else {}
+)
+
+MAX_BATCH_VINS = int(os.getenv('MAX_BATCH_VINS', '500'))
+BULK_WRITE_BATCH_SIZE = int(os.getenv('BULK_WRITE_BATCH_SIZE', '1000'))
+MAX_BULK_RECORDS = int(os.getenv('MAX_BULK_RECORDS', '100000'))
+MAX_BULK_BYTES = int(os.getenv('MAX_BULK_BYTES', str(16 * 1024 * 1024)))
+
+vin_cache = VINCache(
+    max_size=int(os.getenv('VIN_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('VIN_CACHE_TTL', '300')),
+    miss_ttl=float(os.getenv('VIN_CACHE_MISS_TTL', '30'))
+)
+
+mongo_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv('MONGO_BREAKER_FAILURES', '3')),
+    reset_timeout=float(os.getenv('MONGO_BREAKER_RESET_SECONDS', '10'))
+)
+mongo_monitor = MongoHealthMonitor(mongo_breaker)
+
+# One client per worker, created inside the worker's event loop
+_mongo_client = None
+
+def get_db():
+    if _mongo_client is None:
+        raise DatabaseUnavailable("MongoDB client is not initialised")
+    return _mongo_client.vin_database
+
+@asynccontextmanager
+async def lifespan(app):
+    global _mongo_client
+    logger.info("Creating new async MongoDB client connection")
+    _mongo_client = AsyncMongoClient(
+        MONGO_URI,
+        serverSelectionTimeoutMS=5000,
+        connectTimeoutMS=5000,
+        socketTimeoutMS=5000,
+        heartbeatFrequencyMS=int(os.getenv('MONGO_HEARTBEAT_MS', '10000')),
+        event_listeners=[mongo_monitor, metrics.command_listener, metrics.pool_listener],
+        **MONGO_TLS_OPTIONS
+    )
+    try:
+        # Test connection once at startup; afterwards the heartbeat monitor tracks health
+        await _mongo_client.admin.command('ping')
+        if os.getenv('MONGO_ENSURE_INDEXES', 'true').lower() in ('1', 'true', 'yes'):
+            await ensure_indexes_async(_mongo_client.vin_database)
+    except errors.OperationFailure as e:
+        logger.error(f"Failed to ensure vin_records indexes: {str(e)}")
+    except Exception as e:
+        logger.error(f"Initial MongoDB ping failed: {str(e)}")
+        mongo_breaker.record_failure(e)
+    try:
+        yield
+    finally:
+        await _mongo_client.close()
+        _mongo_client = None
+
+async def retry_with_backoff(func, max_retries=3):
+    """Retry coroutine function with exponential backoff, failing fast while the circuit breaker is open"""
+    for attempt in range(max_retries):
+        if not mongo_breaker.allow_request():
+            raise DatabaseUnavailable("MongoDB is unavailable (circuit breaker open)")
+        try:
+            result = await func()
+        except (errors.ServerSelectionTimeoutError,
+                errors.ConnectionFailure,
+                errors.NetworkTimeout,
+                AutoReconnect) as e:
+            mongo_breaker.record_failure(e)
+            if attempt == max_retries - 1 or mongo_breaker.state != CircuitBreaker.CLOSED:
+                logger.error(f"Final retry attempt failed: {str(e)}")
+                raise
+            wait_time = (2 ** attempt) * 0.1  # 0.1s, 0.2s, 0.4s
+            logger.warning(f"Retry attempt {attempt + 1}/{max_retries}. Waiting {wait_time}s")
+            metrics.registry.inc('mongodb_retries_total', (('error', type(e).__name__),))
+            # Unlike time.sleep in the Flask app, this doesn't block other requests
+            await asyncio.sleep(wait_time)
+        except Exception:
+            mongo_breaker.record_success()
+            raise
+        else:
+            mongo_breaker.record_success()
+            return result
+
+def json_default(value):
+    # Match Flask's jsonify, which renders datetimes as HTTP dates
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+    return str(value)
+
+class FlaskStyleJSONResponse(JSONResponse):
+    """JSON response rendered the way Flask 2.0's jsonify does (sorted keys, HTTP dates)"""
+
+    def render(self, content):
+        return json.dumps(content, default=json_default, sort_keys=True).encode('utf-8')
+
+def jsonify(content, status_code=200, headers=None):
+    return FlaskStyleJSONResponse(content, status_code=status_code, headers=headers)
+
+def is_json(content_type):
+    """Same test as Flask's request.is_json: application/json or application/*+json"""
+    return content_type == 'application/json' or (
+        content_type.startswith('application/') and content_type.endswith('+json')
+    )
+
+def mimetype(request):
+    return request.headers.get('content-type', '').split(';')[0].strip().lower()
+
+async def get_json(request):
+    """Like Flask's request.get_json(silent=True)"""
+    if not is_json(mimetype(request)):
+        return None
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+def require_api_key(f):
+    @wraps(f)
+    async def decorated(request):
+        api_key = request.headers.get('X-API-Key')
+        if api_key and api_key == API_KEY:
+            return await f(request)
+        logger.warning(f"Invalid API key attempt: {api_key}")
+        return jsonify({'error': 'Invalid API key'}, 401)
+    return decorated
+
+def database_error(e):
+    return jsonify({
+        'error': 'Database connection error',
+        'message': 'Unable to connect to database',
+        'details': str(e)
+    }, 503)
+
+@require_api_key
+async def check_vin(request: Request):
+    try:
+        client_ip = request.headers.get('X-Forwarded-For', request.client.host if request.client else None)
+        logger.info(f"Request from IP: {client_ip}")
+
+        vin = request.query_params.get('vin')
+        if not vin:
+            return jsonify({'error': 'No VIN provided'}, 400)
+
+        logger.info(f"Checking VIN: {vin}")
+
+        cached = vin_cache.get(vin)
+        if cached is not None:
+            logger.info(f"Cache hit for VIN: {vin}")
+            return jsonify(cached)
+
+        async def query_vin():
+            db = get_db()
+            return await db.vin_records.find_one(lookup_filter(vin), VIN_LOOKUP_PROJECTION, max_time_ms=5000)
+
+        version = vin_cache.version()
+        result = await retry_with_backoff(query_vin)
+        response = lookup_result(result)
+        logger.info(f"{'Found' if result else 'VIN not found'}: {vin}")
+        vin_cache.set(vin, response, since=version)
+        return jsonify(response)
+    except DatabaseUnavailable:
+        # Circuit breaker open: answer with Retry-After like the write routes
+        raise
+    except Exception as e:
+        logger.error(f"Error checking VIN: {str(e)}")
+        return database_error(e)
+
+@require_api_key
+async def check_vins(request: Request):
+    """Look up many VINs with a single $in query"""
+    try:
+        data = await get_json(request) if request.method == 'POST' else None
+        vins = collect_vins(request.query_params.getlist('vin'), data)
+        if not vins:
+            return jsonify({'error': 'No VINs provided'}, 400)
+        if len(vins) > MAX_BATCH_VINS:
+            return jsonify({
+                'error': 'Too many VINs',
+                'message': f'At most {MAX_BATCH_VINS} VINs per request'
+            }, 400)
+
+        results = {}
+        uncached = []
+        for vin in vins:
+            cached = vin_cache.get(vin)
+            if cached is not None:
+                results[vin] = cached
+            else:
+                uncached.append(vin)
+
+        if uncached:
+            async def query_vins():
+                db = get_db()
+                cursor = db.vin_records.find(
+                    lookup_many_filter(uncached),
+                    VIN_LOOKUP_PROJECTION,
+                    max_time_ms=5000
+                )
+                return await cursor.to_list(None)
+
+            version = vin_cache.version()
+            records = await retry_with_backoff(query_vins)
+            found = {record['vin_value']: record for record in records}
+            for vin in uncached:
+                results[vin] = lookup_result(found.get(vin))
+                vin_cache.set(vin, results[vin], since=version)
+
+        results = {vin: results[vin] for vin in vins}
+        found_count = sum(1 for result in results.values() if result['found'])
+        logger.info(f"Batch lookup found {found_count} of {len(vins)} VINs ({len(vins) - len(uncached)} cached)")
+        return jsonify({
+            'results': results,
+            'found_count': found_count,
+            'not_found_count': len(vins) - found_count
+        })
+    except DatabaseUnavailable:
+        # Circuit breaker open: answer with Retry-After like the write routes
+        raise
+    except Exception as e:
+        logger.error(f"Error checking VINs: {str(e)}")
+        return database_error(e)
+
+@require_api_key
+async def add_vin(request: Request):
+    data = await get_json(request)
+    if not data or not isinstance(data, dict) or 'vin_value' not in data:
+        return jsonify({'error': 'No VIN provided'}, 400)
+
+    logger.info(f"Adding VIN: {data['vin_value']}")
+    scan_date = datetime.utcnow()
+
+    async def upsert_vin():
+        db = get_db()
+        return await db.vin_records.update_one(
+            lookup_filter(data['vin_value']),
+            upsert_update(data['vin_value'], data.get('description', ''), scan_date),
+            upsert=True
+        )
+
+    try:
+        result = await retry_with_backoff(upsert_vin)
+    except Exception:
+        vin_cache.invalidate(data['vin_value'])
+        raise
+
+    vin_cache.set(data['vin_value'], {
+        'found': True,
+        'description': data.get('description', ''),
+        'scan_date': scan_date
+    })
+    logger.info(f"Successfully added/updated VIN: {data['vin_value']}")
+    return jsonify({
+        'success': True,
+        'modified_count': result.modified_count,
+        'upserted_id': str(result.upserted_id) if result.upserted_id else None
+    })
+
+async def read_bulk_records(request):
+    """Read records from a JSON array ({"records": [...]} also accepted) or an NDJSON body
+
+    At most MAX_BULK_BYTES of body and MAX_BULK_RECORDS records are read.
+    """
+    check_body_size(request.headers.get('content-length'), MAX_BULK_BYTES)
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_BULK_BYTES:
+            raise PayloadTooLarge(f'Request body larger than {MAX_BULK_BYTES} bytes')
+        chunks.append(chunk)
+    body = b''.join(chunks)
+
+    content_type = mimetype(request)
+    if content_type in NDJSON_MIMETYPES:
+        return parse_ndjson_lines(body.splitlines(), MAX_BULK_RECORDS)
+    if not is_json(content_type):
+        # Flask only parses bodies sent as JSON (request.is_json)
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    return bulk_records_from_json(data, MAX_BULK_RECORDS)
+
+@require_api_key
+async def add_vins(request: Request):
+    """Upsert many VINs with unordered bulk_write batches"""
+    records = await read_bulk_records(request)
+    if not records:
+        return jsonify({'error': 'No VINs provided'}, 400)
+
+    try:
+        batch_size = int(request.query_params.get('batch_size', BULK_WRITE_BATCH_SIZE))
+    except ValueError:
+        batch_size = BULK_WRITE_BATCH_SIZE
+    if batch_size < 1:
+        return jsonify({'error': 'batch_size must be a positive integer'}, 400)
+
+    merged, results, duplicates = merge_bulk_records(records)
+    logger.info(f"Bulk adding {len(merged)} VINs ({duplicates} duplicates merged)")
+
+    scan_date = datetime.utcnow()
+    upserted_count = 0
+    modified_count = 0
+
+    for start in range(0, len(merged), batch_size):
+        batch = merged[start:start + batch_size]
+        operations = bulk_upsert_operations(batch, scan_date)
+
+        async def write_batch():
+            db = get_db()
+            return await db.vin_records.bulk_write(operations, ordered=False)
+
+        try:
+            details = (await retry_with_backoff(write_batch, max_retries=1)).bulk_api_result
+        except errors.BulkWriteError as e:
+            details = e.details
+            logger.warning(f"Bulk write batch had {len(details.get('writeErrors', []))} errors")
+        except Exception:
+            for record in batch:
+                vin_cache.invalidate(record['vin_value'])
+            raise
+
+        upserted_count += details.get('nUpserted', 0)
+        modified_count += details.get('nModified', 0)
+
+        batch_results = bulk_batch_results(batch, details)
+        for record, result in zip(batch, batch_results):
+            if result['status'] == 'error':
+                vin_cache.invalidate(record['vin_value'])
+            else:
+                vin_cache.set(record['vin_value'], {
+                    'found': True,
+                    'description': record['description'],
+                    'scan_date': scan_date
+                })
+        results.extend(batch_results)
+
+    error_count = sum(1 for item in results if item['status'] == 'error')
+    logger.info(f"Bulk add finished: {upserted_count} upserted, {modified_count} modified, {error_count} errors")
+    return jsonify({
+        'success': error_count == 0,
+        'received': len(records),
+        'duplicates_merged': duplicates,
+        'upserted_count': upserted_count,
+        'modified_count': modified_count,
+        'error_count': error_count,
+        'results': results
+    })
+
+@require_api_key
+async def cache_stats(request: Request):
+    return jsonify(vin_cache.stats())
+
+@require_api_key
+async def index_stats(request: Request):
+    # The Bloom-filter membership index is only available in the Flask app
+    return jsonify({'enabled': False})
+
+async def metrics_endpoint(request: Request):
+    """Prometheus text-format metrics for this worker process"""
+    return PlainTextResponse(metrics.registry.render(), media_type='text/plain; version=0.0.4')
+
+async def health_check(request: Request):
+    """Health check endpoint, reporting the shared health state instead of pinging"""
+    health = {
+        'circuit_breaker': mongo_breaker.status(),
+        'monitor': mongo_monitor.status()
+    }
+    if mongo_breaker.state == CircuitBreaker.OPEN or _mongo_client is None:
+        return jsonify({
+            'status': 'unhealthy',
+            'message': 'Database connection failed',
+            'error': mongo_breaker.last_error,
+            **health
+        }, 500)
+    return jsonify({
+        'status': 'healthy',
+        'message': 'Connected to MongoDB',
+        **health
+    })
+
+async def handle_database_unavailable(request, e):
+    logger.warning(f"Rejecting request, {str(e)}")
+    return jsonify({
+        'error': 'Database connection error',
+        'message': 'Unable to connect to database',
+        'details': str(e)
+    }, 503, {'Retry-After': str(int(mongo_breaker.reset_timeout))})
+
+async def handle_payload_too_large(request, e):
+    logger.warning(f"Rejecting request, {str(e)}")
+    return jsonify({
+        'error': 'Payload too large',
+        'message': str(e)
+    }, 413)
+
+async def handle_500(request, e):
+    logger.error(f"Internal Server Error: {str(e)}")
+    return jsonify({
+        'error': 'Internal Server Error',
+        'message': str(e)
+    }, 500)
+
+class RequestMetricsMiddleware:
+    """Per-route request counts, latency and in-flight gauges (pure ASGI, no per-request tasks)"""
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        # Routes have no path parameters, so the path is the route template
+        route = scope['path'] if scope['path'] in self.routes else 'unmatched'
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        metrics.registry.add_gauge('http_requests_in_flight', (('route', route),), 1)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            labels = (('route', route), ('method', scope['method']), ('status', str(status['code'])))
+            metrics.registry.add_gauge('http_requests_in_flight', (('route', route),), -1)
+            metrics.registry.inc('http_requests_total', labels)
+            metrics.registry.observe('http_request_duration_seconds', labels, time.perf_counter() - started)
+
+routes = [
+    Route('/api/check_vin', check_vin, methods=['GET']),
+    Route('/api/check_vins', check_vins, methods=['GET', 'POST']),
+    Route('/api/add_vin', add_vin, methods=['POST']),
+    Route('/api/add_vins', add_vins, methods=['POST']),
+    Route('/api/cache_stats', cache_stats, methods=['GET']),
+    Route('/api/index_stats', index_stats, methods=['GET']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Route('/', health_check, methods=['GET'])
+]
+
+app = Starlette(
+    routes=routes,
+    exception_handlers={
+        DatabaseUnavailable: handle_database_unavailable,
+        PayloadTooLarge: handle_payload_too_large,
+        Exception: handle_500
+    },
+    lifespan=lifespan
+)
+app.add_middleware(RequestMetricsMiddleware, routes={route.path for route in routes})
@@ -0,0 +1,136 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import json
+import sys
+import time
+from decode_strategy import FrameDecoder
+from frame_sources import plan_tasks, task_frames
+from vin_lookup import LocalVINLookup
+from vin_validation import validate_vin
+
+# Headless batch scanning of recorded footage and photo dumps (t.py --headless).
+#
+# Each source is split into tasks (video segments / image chunks, see
+# frame_sources.plan_tasks). Worker processes open their task's file
+# themselves and decode it with their own FrameDecoder, so only the decoded
+# VIN strings travel back. Results are collected in task order, so the first
+# sighting of a VIN is emitted as soon as everything before it is done. The
+# parent process validates and looks up each new VIN and writes one NDJSON
+# record per sighting.
+
+# Frames per video task; about 30 s of 30 fps footage, large enough that the
+# seek at the start of each segment is noise
+SEGMENT_FRAMES = 900
+IMAGES_PER_TASK = 50
+
+# Lookup status values in the NDJSON records
+FOUND = 'found'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+ERROR = 'error'
+
+def _scan_task(task, stride, strategy):
+    """Decode one task; returns (frames decoded, footage seconds, [(frame, offset, captured_at, vin)])"""
+    # A fresh decoder per task: ROI tracking follows the consecutive frames
+    # of one segment and never leaks into the next file
+    decoder = FrameDecoder(strategy)
+    frames = 0
+    last_index = None
+    hits = []
+    for frame_index, offset, captured_at, frame in task_frames(task, stride):
+        frames += 1
+        last_index = frame_index
+        seen = set()
+        for obj in decoder(frame):
+            try:
+                vin = obj.data.decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+            if vin not in seen:
+                seen.add(vin)
+                hits.append((frame_index, offset, captured_at, vin))
+    footage = 0.0
+    if task[0] == 'video' and last_index is not None:
+        _, _, start, _, fps = task
+        footage = (last_index - start + 1) / fps
+    return frames, footage, hits
+
+def sighting_time(offset, captured_at):
+    """Seconds on the source's own clock, for the dedupe window"""
+    if offset is not None:
+        return offset
+    return datetime.fromisoformat(captured_at).timestamp()
+
+class VINDeduper:
+    """Report a VIN once per source, or again after window seconds without a sighting"""
+
+    def __init__(self, window=None):
+        self.window = window
+        self._last_seen = {}
+
+    def is_new(self, source, vin, when):
+        key = (source, vin)
+        last = self._last_seen.get(key)
+        self._last_seen[key] = when
+        return last is None or (self.window is not None and when - last > self.window)
+
+def lookup_status(lookup, vin, check_digit=True):
+    """(normalized vin, status, reason) for one decoded string"""
+    vin, reason = validate_vin(vin, check_digit)
+    if reason:
+        return vin, INVALID, reason
+    try:
+        return vin, FOUND if lookup.exists(vin) else NOT_FOUND, None
+    except Exception as e:
+        return vin, ERROR, str(e)
+
+def batch_scan(sources, db_path='vin_database.db', snapshot_path=None, workers=None, strategy='adaptive',
+               stride=1, dedupe_window=None, output=sys.stdout, check_digit=True):
+    """Scan file-based sources and write NDJSON sightings to output; returns a stats dict"""
+    tasks = []
+    for source in sources:
+        tasks += [(source, task) for task in plan_tasks(source, SEGMENT_FRAMES, IMAGES_PER_TASK)]
+
+    lookup = LocalVINLookup(db_path, snapshot_path)
+    deduper = VINDeduper(dedupe_window)
+    stats = {'sources': len(sources), 'tasks': len(tasks), 'frames': 0, 'footage_seconds': 0.0,
+             'sightings': 0, 'records': 0}
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_scan_task, [task for _, task in tasks], [stride] * len(tasks),
+                               [strategy] * len(tasks))
+            for (source, _), (frames, footage, hits) in zip(tasks, results):
+                stats['frames'] += frames
+                stats['footage_seconds'] += footage
+                for frame_index, offset, captured_at, raw_vin in hits:
+                    stats['sightings'] += 1
+                    if not deduper.is_new(source, raw_vin, sighting_time(offset, captured_at)):
+                        continue
+                    vin, status, reason = lookup_status(lookup, raw_vin, check_digit)
+                    record = {
+                        'vin': vin,
+                        'status': status,
+                        'reason': reason,
+                        'source': source,
+                        'frame': frame_index,
+                        'offset_seconds': round(offset, 3) if offset is not None else None,
+                        'captured_at': captured_at,
+                        'scanned_at': datetime.now(timezone.utc).isoformat()
+                    }
+                    output.write(json.dumps(record) + '\n')
+                    stats['records'] += 1
+                output.flush()
+    finally:
+        lookup.close()
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+def format_batch_stats(stats, stride):
+    seconds = max(stats['seconds'], 1e-9)
+    text = (f"Batch scan: {stats['sources']} sources in {stats['tasks']} tasks, "
+            f"{stats['frames']} frames decoded (every {stride}) in {stats['seconds']:.1f}s "
+            f"({stats['frames'] / seconds:.0f} fps), {stats['sightings']} sightings -> {stats['records']} records")
+    if stats['footage_seconds']:
+        text += f"; {stats['footage_seconds']:.0f}s of video at {stats['footage_seconds'] / seconds:.1f}x real time"
+    return text
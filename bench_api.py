@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+import requests
+from loadgen import run_load
+
+# Reproducible load tests for the VIN API.
+#
+#   python bench_api.py --backend fake --vins 10000 --concurrency 32 --output bench.json
+#   python bench_api.py --backend mongod --mongo-uri mongodb://127.0.0.1:27017 --app flask
+#
+# "fake" runs app.py in a threaded werkzeug server on top of mongomock, which
+# measures the application's own overhead. "mongod" runs the real server
+# command (gunicorn or uvicorn) against a local mongod, and DROPS and reseeds
+# vin_database.vin_records on that server.
+
+BENCH_API_KEY = 'bench-api-key'
+SCENARIOS = ('cold_start', 'warm_uncached', 'warm_cached', 'write_burst')
+
+def make_vins(count, prefix, seed):
+    """Deterministic 17-character VIN-like strings"""
+    rng = random.Random(seed)
+    alphabet = 'ABCDEFGHJKLMNPRSTUVWXYZ0123456789'
+    return [prefix + ''.join(rng.choice(alphabet) for _ in range(17 - len(prefix))) for _ in range(count)]
+
+def seed_documents(vins):
+    scan_date = datetime.utcnow()
+    return [{'vin_value': vin, 'description': f'bench record {i}', 'scan_date': scan_date}
+            for i, vin in enumerate(vins)]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def serve_fake(port, vin_count, seed):
+    """Run app.py on mongomock in this process (used as the server subprocess)"""
+    import mongomock
+    import app as vin_app
+    from werkzeug.serving import make_server
+
+    vin_app.MongoClient = mongomock.MongoClient
+    collection = vin_app.get_mongo_client().vin_database.vin_records
+    if vin_count:
+        collection.insert_many(seed_documents(make_vins(vin_count, 'H', seed)))
+    make_server('127.0.0.1', port, vin_app.app, threaded=True).serve_forever()
+
+def seed_mongod(mongo_uri, vin_count, seed):
+    from pymongo import MongoClient
+    from db_schema import ensure_indexes
+
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    try:
+        db = client.vin_database
+        db.vin_records.drop()
+        ensure_indexes(db)
+        documents = seed_documents(make_vins(vin_count, 'H', seed))
+        for start in range(0, len(documents), 10000):
+            db.vin_records.insert_many(documents[start:start + 10000], ordered=False)
+    finally:
+        client.close()
+
+class ServerProcess:
+    """The API under test, started fresh for each scenario"""
+
+    def __init__(self, args, env_overrides):
+        self.args = args
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        env = dict(os.environ)
+        env.update({'API_KEY': BENCH_API_KEY, 'PYTHONUNBUFFERED': '1'})
+        env.update(env_overrides)
+
+        if args.backend == 'fake':
+            command = [sys.executable, os.path.abspath(__file__), '--serve-fake', str(self.port),
+                       '--vins', str(args.vins), '--seed', str(args.seed)]
+            env['MONGO_URI'] = 'mongodb://mongomock'
+        else:
+            env.update({'MONGO_URI': args.mongo_uri, 'MONGO_TLS': 'false'})
+            if args.app == 'asgi':
+                command = ['uvicorn', 'asgi_app:app', '--host', '127.0.0.1', '--port', str(self.port),
+                           '--workers', str(args.workers), '--log-level', 'warning']
+            else:
+                command = ['gunicorn', 'app:app', '--bind', f'127.0.0.1:{self.port}',
+                           '--workers', str(args.workers), '--log-level', 'warning']
+
+        self.started = time.perf_counter()
+        self.process = subprocess.Popen(
+            command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def wait_ready(self, timeout=60.0):
+        """Seconds from spawn until the health check first answers 200"""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'server exited with code {self.process.returncode}')
+            try:
+                if requests.get(self.base_url + '/', timeout=1).status_code == 200:
+                    return time.perf_counter() - self.started
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        raise RuntimeError('server did not become ready')
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+def mixed_request(base_url, hit_vins, miss_vins, hit_ratio, write_ratio, timeout=10.0):
+    """check_vin at the given hit ratio, interleaved with add_vin at write_ratio"""
+    check_url = f'{base_url}/api/check_vin'
+    add_url = f'{base_url}/api/add_vin'
+    headers = {'X-API-Key': BENCH_API_KEY}
+
+    def make_request(session, rng):
+        if write_ratio and rng.random() < write_ratio:
+            vin = rng.choice(miss_vins) if rng.random() < 0.5 else rng.choice(hit_vins)
+            response = session.post(add_url, json={'vin_value': vin, 'description': 'bench write'},
+                                    headers=headers, timeout=timeout)
+        else:
+            vin = rng.choice(hit_vins) if rng.random() < hit_ratio else rng.choice(miss_vins)
+            response = session.get(check_url, params={'vin': vin}, headers=headers, timeout=timeout)
+        return response.status_code == 200
+
+    return make_request
+
+def run_scenario(name, args, hit_vins, miss_vins):
+    if name == 'warm_cached':
+        env = {'VIN_CACHE_SIZE': '100000'}
+    else:
+        # Every other scenario measures the database path, not the cache
+        env = {'VIN_CACHE_SIZE': '0', 'VIN_INDEX_ENABLED': 'false'}
+    write_ratio = args.write_ratio if name == 'write_burst' else 0.0
+
+    server = ServerProcess(args, env)
+    try:
+        ready_s = server.wait_ready()
+        make_request = mixed_request(server.base_url, hit_vins, miss_vins, args.hit_ratio, write_ratio)
+        result = {'ready_s': round(ready_s, 3), 'hit_ratio': args.hit_ratio, 'write_ratio': write_ratio}
+
+        if name == 'cold_start':
+            # The very first requests, with no warm-up: connection setup, empty pools
+            first = time.perf_counter()
+            make_request(requests.Session(), random.Random(args.seed))
+            result['first_request_ms'] = round((time.perf_counter() - first) * 1000, 2)
+            result.update(run_load(make_request, args.concurrency, args.duration, max_requests=args.cold_requests))
+        else:
+            if args.warmup:
+                run_load(make_request, args.concurrency, args.warmup)
+            result.update(run_load(make_request, args.concurrency, args.duration))
+        return result
+    finally:
+        server.stop()
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the VIN API and report throughput/latency as JSON')
+    parser.add_argument('--backend', choices=('fake', 'mongod'), default='fake')
+    parser.add_argument('--mongo-uri', help='local mongod for --backend mongod (its vin_database is reseeded)')
+    parser.add_argument('--app', choices=('flask', 'asgi'), default='flask', help='server to run with --backend mongod')
+    parser.add_argument('--workers', type=int, default=2, help='server worker processes for --backend mongod')
+    parser.add_argument('--vins', type=int, default=10000, help='VINs to seed')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=15.0, help='seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--hit-ratio', type=float, default=0.5, help='fraction of lookups for seeded VINs')
+    parser.add_argument('--write-ratio', type=float, default=0.9, help='fraction of add_vin calls in write_burst')
+    parser.add_argument('--cold-requests', type=int, default=500, help='requests measured in cold_start')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='default: all')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--serve-fake', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_fake:
+        serve_fake(args.serve_fake, args.vins, args.seed)
+        return
+    if args.backend == 'mongod':
+        if not args.mongo_uri:
+            parser.error('--backend mongod needs --mongo-uri')
+        if args.mongo_uri.startswith('mongodb+srv://'):
+            parser.error('refusing to reseed a remote (mongodb+srv) cluster; point --mongo-uri at a local mongod')
+        seed_mongod(args.mongo_uri, args.vins, args.seed)
+
+    hit_vins = make_vins(args.vins, 'H', args.seed)
+    miss_vins = make_vins(max(args.vins, 1000), 'M', args.seed + 1)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('serve_fake', 'output')},
+        'scenarios': {}
+    }
+    for name in args.scenario or SCENARIOS:
+        print(f'Running {name}...', file=sys.stderr)
+        report['scenarios'][name] = run_scenario(name, args, hit_vins, miss_vins)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+from vin_validation import VIN_CHARACTERS, compute_check_digit, validate_vin
+from decode_strategy import STRATEGIES
+from scan_pipeline import format_stats
+from t import VINScanner, SCANNING, SHOWING_RESULT
+
+# Reproducible decoder benchmark for the desktop scanner, on synthetic frames.
+#
+#   python bench_decoder.py --frames 240 --output bench_decoder.json
+#   python bench_decoder.py --strategy adaptive --symbology qr --resolution 1920x1080
+#
+# Frames come in short runs: one VIN code (QR or Code 39) per run, drifting a
+# few pixels per frame like a label held in front of a camera, over a
+# cluttered background. Each run draws its resolution, module size, rotation,
+# blur and noise from the lists given on the command line. The same seed gives
+# the same frames for every strategy.
+#
+# Each frame goes through the path t.py runs per frame: FrameDecoder, reading
+# and validating the decoded VIN, then frame.copy() and the status/stats
+# overlays (VINScanner.draw_state, draw_stats_footer). Frame generation is not
+# timed. Runs headless: nothing is shown.
+
+SYMBOLOGIES = ('qr', 'code39')
+
+# Code 39 patterns: 5 bars and 4 spaces, alternating from a bar; n(arrow) or w(ide)
+CODE39 = {
+    '0': 'nnnwwnwnn', '1': 'wnnwnnnnw', '2': 'nnwwnnnnw', '3': 'wnwwnnnnn', '4': 'nnnwwnnnw',
+    '5': 'wnnwwnnnn', '6': 'nnwwwnnnn', '7': 'nnnwnnwnw', '8': 'wnnwnnwnn', '9': 'nnwwnnwnn',
+    'A': 'wnnnnwnnw', 'B': 'nnwnnwnnw', 'C': 'wnwnnwnnn', 'D': 'nnnnwwnnw', 'E': 'wnnnwwnnn',
+    'F': 'nnwnwwnnn', 'G': 'nnnnnwwnw', 'H': 'wnnnnwwnn', 'I': 'nnwnnwwnn', 'J': 'nnnnwwwnn',
+    'K': 'wnnnnnnww', 'L': 'nnwnnnnww', 'M': 'wnwnnnnwn', 'N': 'nnnnwnnww', 'O': 'wnnnwnnwn',
+    'P': 'nnwnwnnwn', 'Q': 'nnnnnnwww', 'R': 'wnnnnnwwn', 'S': 'nnwnnnwwn', 'T': 'nnnnwnwwn',
+    'U': 'wwnnnnnnw', 'V': 'nwwnnnnnw', 'W': 'wwwnnnnnn', 'X': 'nwnnwnnnw', 'Y': 'wwnnwnnnn',
+    'Z': 'nwwnwnnnn', '-': 'nwnnnnwnw', '.': 'wwnnnnwnn', ' ': 'nwwnnnwnn', '*': 'nwnnwnwnn'
+}
+CODE39_WIDE = 3
+# White margin around a code: modules for QR, narrow bars for Code 39
+QR_QUIET_ZONE = 4
+CODE39_QUIET_ZONE = 10
+# Runs drawn in a row whose code does not fit the frame before giving up
+MAX_MISFITS = 100
+
+def make_vin(rng):
+    """Random VIN with a valid check digit and model year code"""
+    chars = [VIN_CHARACTERS[i] for i in rng.integers(0, len(VIN_CHARACTERS), 17)]
+    chars[9] = 'ABCDEFGHJKLMNPRSTVWXY123456789'[rng.integers(0, 30)]
+    chars[8] = compute_check_digit(''.join(chars))
+    return ''.join(chars)
+
+def qr_modules(vin):
+    """QR code as a 0/255 array, one pixel per module, with a quiet zone"""
+    code = cv2.QRCodeEncoder.create().encode(vin)
+    return cv2.copyMakeBorder(code, QR_QUIET_ZONE, QR_QUIET_ZONE, QR_QUIET_ZONE, QR_QUIET_ZONE,
+                              cv2.BORDER_CONSTANT, value=255)
+
+def code39_modules(vin, height_ratio=0.15):
+    """Code 39 barcode as a 0/255 array, one pixel per narrow bar, with a quiet zone"""
+    row = [255] * CODE39_QUIET_ZONE
+    for char in f'*{vin}*':
+        for position, width in enumerate(CODE39[char]):
+            row += [0 if position % 2 == 0 else 255] * (CODE39_WIDE if width == 'w' else 1)
+        row.append(255)  # inter-character gap
+    row += [255] * CODE39_QUIET_ZONE
+    height = max(int(len(row) * height_ratio), 8)
+    return np.tile(np.array(row, dtype=np.uint8), (height, 1))
+
+def background(rng, width, height):
+    """Smooth colour gradient with random boxes, so a decoder has something to reject"""
+    corners = rng.integers(40, 220, (2, 2, 3)).astype(np.uint8)
+    frame = cv2.resize(corners, (width, height), interpolation=cv2.INTER_LINEAR)
+    for _ in range(12):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        w, h = int(rng.integers(10, width // 4)), int(rng.integers(10, height // 4))
+        cv2.rectangle(frame, (x, y), (x + w, y + h), tuple(int(c) for c in rng.integers(0, 256, 3)), -1)
+    return frame
+
+def render_code(modules, module_px, rotation):
+    """Scale a module array and rotate it; returns (patch, mask)"""
+    patch = cv2.resize(modules, None, fx=module_px, fy=module_px, interpolation=cv2.INTER_NEAREST)
+    mask = np.full(patch.shape, 255, np.uint8)
+    if rotation:
+        height, width = patch.shape
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), rotation, 1.0)
+        cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+        out_w, out_h = int(height * sin + width * cos) + 1, int(height * cos + width * sin) + 1
+        matrix[0, 2] += out_w / 2 - width / 2
+        matrix[1, 2] += out_h / 2 - height / 2
+        patch = cv2.warpAffine(patch, matrix, (out_w, out_h), flags=cv2.INTER_LINEAR, borderValue=255)
+        mask = cv2.warpAffine(mask, matrix, (out_w, out_h), flags=cv2.INTER_NEAREST, borderValue=0)
+    return patch, mask
+
+def generate_frames(args, seed):
+    """Yield (frame, params) for args.frames frames, in runs of args.run_length"""
+    rng = np.random.default_rng(seed)
+    produced = misfits = 0
+    while produced < args.frames:
+        width, height = args.resolutions[rng.integers(0, len(args.resolutions))]
+        symbology = args.symbologies[rng.integers(0, len(args.symbologies))]
+        rotation = float(args.rotations[rng.integers(0, len(args.rotations))])
+        blur = float(args.blurs[rng.integers(0, len(args.blurs))])
+        noise = float(args.noises[rng.integers(0, len(args.noises))])
+        module_px = float(args.module_sizes[rng.integers(0, len(args.module_sizes))])
+        vin = make_vin(rng)
+        modules = qr_modules(vin) if symbology == 'qr' else code39_modules(vin)
+
+        # Shrink the code until it fits with room to drift
+        patch, mask = render_code(modules, module_px, rotation)
+        while (patch.shape[1] > 0.9 * width or patch.shape[0] > 0.9 * height) and module_px > 1.0:
+            module_px = max(module_px - 0.5, 1.0)
+            patch, mask = render_code(modules, module_px, rotation)
+        if patch.shape[1] > width or patch.shape[0] > height:
+            misfits += 1
+            if misfits >= MAX_MISFITS:
+                raise ValueError('codes do not fit the frames; add a larger --resolution or smaller --rotation')
+            continue
+        misfits = 0
+
+        base = background(rng, width, height)
+        x = int(rng.integers(0, width - patch.shape[1] + 1))
+        y = int(rng.integers(0, height - patch.shape[0] + 1))
+        dx, dy = (int(v) for v in rng.integers(-4, 5, 2))
+        params = {'symbology': symbology, 'vin': vin, 'resolution': f'{width}x{height}',
+                  'module_px': module_px, 'rotation': rotation, 'blur': blur, 'noise': noise}
+        for _ in range(min(args.run_length, args.frames - produced)):
+            frame = base.copy()
+            region = frame[y:y + patch.shape[0], x:x + patch.shape[1]]
+            covered = mask > 0
+            region[covered] = patch[covered][:, None]
+            if blur:
+                frame = cv2.GaussianBlur(frame, (0, 0), blur)
+            if noise:
+                frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+            yield frame, params
+            produced += 1
+            x = min(max(x + dx, 0), width - patch.shape[1])
+            y = min(max(y + dy, 0), height - patch.shape[0])
+
+def percentiles(samples):
+    values = np.array(samples) * 1000.0
+    if not len(values):
+        return {'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0}
+    return {'mean_ms': round(float(values.mean()), 3),
+            'p50_ms': round(float(np.percentile(values, 50)), 3),
+            'p95_ms': round(float(np.percentile(values, 95)), 3)}
+
+def run_strategy(strategy, args):
+    # ':memory:' keeps VINScanner.setup_database off disk; lookups never run
+    scanner = VINScanner(':memory:', decode_strategy=strategy)
+    scanner.lookup_executor.shutdown()
+    decoder = scanner.decoder
+    stages = {'decode': [], 'validate': [], 'overlay': [], 'total': []}
+    groups = {}
+    detected = misreads = frames = 0
+
+    for frame, params in generate_frames(args, args.seed):
+        started = time.perf_counter()
+        objects = decoder(frame)
+        decoded_at = time.perf_counter()
+        vins = []
+        for obj in objects:
+            try:
+                vins.append(validate_vin(obj.data.decode('utf-8'))[0])
+            except UnicodeDecodeError:
+                vins.append(None)
+        validated_at = time.perf_counter()
+        display_frame = frame.copy()
+        if vins:
+            scanner.state, scanner.current_vin = SHOWING_RESULT, vins[0]
+            scanner.result = (True, 'VIN found in database')
+        else:
+            scanner.state = SCANNING
+        scanner.draw_state(display_frame)
+        scanner.draw_stats_footer(display_frame, format_stats(
+            {'capture_fps': 30.0, 'decode_fps': 30.0, 'decode_ms': 1000.0 * (decoded_at - started), 'frames_dropped': 0}
+        ))
+        finished = time.perf_counter()
+
+        hit = params['vin'] in vins
+        frames += 1
+        detected += hit
+        misreads += sum(vin != params['vin'] for vin in vins)
+        stages['decode'].append(decoded_at - started)
+        stages['validate'].append(validated_at - decoded_at)
+        stages['overlay'].append(finished - validated_at)
+        stages['total'].append(finished - started)
+        for factor in ('symbology', 'resolution', 'module_px', 'rotation', 'blur', 'noise'):
+            group = groups.setdefault(factor, {}).setdefault(str(params[factor]), [0, 0, 0.0])
+            group[0] += 1
+            group[1] += hit
+            group[2] += decoded_at - started
+
+    seconds = sum(stages['total'])
+    return {
+        'frames': frames,
+        'fps': round(frames / seconds, 2) if seconds else 0.0,
+        'detection_rate': round(detected / frames, 4) if frames else 0.0,
+        'misreads': misreads,
+        'stages': {name: percentiles(samples) for name, samples in stages.items()},
+        'decoder_passes': decoder.stats(),
+        'by_factor': {
+            factor: {value: {'frames': count, 'detection_rate': round(hits / count, 4),
+                             'decode_mean_ms': round(1000.0 * decode_s / count, 3)}
+                     for value, (count, hits, decode_s) in sorted(values.items())}
+            for factor, values in groups.items()
+        }
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def resolution(value):
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {value!r}")
+    return width, height
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the scanner decode + overlay path on synthetic frames')
+    parser.add_argument('--strategy', action='append', choices=STRATEGIES, help='default: all')
+    parser.add_argument('--frames', type=int, default=240, help='frames per strategy')
+    parser.add_argument('--run-length', type=int, default=8, help='consecutive frames showing the same code')
+    parser.add_argument('--symbology', dest='symbologies', action='append', choices=SYMBOLOGIES,
+                        help='default: all')
+    parser.add_argument('--resolution', dest='resolutions', action='append', type=resolution,
+                        help='WIDTHxHEIGHT (default: 640x480, 1280x720, 1920x1080)')
+    parser.add_argument('--module-px', dest='module_sizes', type=float, nargs='+', default=[2.0, 3.0, 5.0],
+                        help='pixels per module / narrow bar (reduced where a code would not fit)')
+    parser.add_argument('--rotation', dest='rotations', type=float, nargs='+', default=[0.0, 5.0, 20.0, 45.0],
+                        help='degrees')
+    parser.add_argument('--blur', dest='blurs', type=float, nargs='+', default=[0.0, 1.0, 2.0],
+                        help='Gaussian blur sigma in pixels')
+    parser.add_argument('--noise', dest='noises', type=float, nargs='+', default=[0.0, 8.0, 20.0],
+                        help='Gaussian noise standard deviation (0-255 scale)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+    args.symbologies = args.symbologies or list(SYMBOLOGIES)
+    args.resolutions = args.resolutions or [(640, 480), (1280, 720), (1920, 1080)]
+    if args.frames < 1 or args.run_length < 1:
+        parser.error('--frames and --run-length must be at least 1')
+
+    config = {key: value for key, value in vars(args).items() if key != 'output'}
+    config['resolutions'] = [f'{width}x{height}' for width, height in args.resolutions]
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(),
+                     'cpus': os.cpu_count(), 'opencv': cv2.__version__},
+        'config': config,
+        'strategies': {}
+    }
+    for strategy in args.strategy or STRATEGIES:
+        print(f'Running {strategy}...', file=sys.stderr)
+        try:
+            report['strategies'][strategy] = run_strategy(strategy, args)
+        except ValueError as e:
+            parser.error(str(e))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,255 @@
 import sqlite3
+from collections import Counter
+from dotenv import load_dotenv
+import argparse
+import certifi
+import json
+import os
+from vin_validation import validate_vins
 
-def check_database():
-    """Check the contents of the VIN database"""
+load_dotenv()
+
+# Report on vin_records without loading the table: counts, histograms and
+# duplicates come from SQL aggregates (or one MongoDB aggregation), VIN
+# validation streams the values through in batches, and records are only
+# listed a page at a time with --limit/--offset.
+
+VALIDATION_BATCH_SIZE = 10000
+# Rows shown per section (top WMIs, duplicate groups, invalid examples)
+DEFAULT_TOP = 10
+# scan_date bucket -> number of leading characters of 'YYYY-MM-DD HH:MM:SS'
+DATE_BUCKETS = {'year': 4, 'month': 7, 'day': 10}
+
+def empty_report():
+    return {'total': 0, 'duplicates': {'groups': 0, 'extra_records': 0, 'top': []},
+            'invalid': {'count': 0, 'reasons': {}, 'examples': []},
+            'wmi': [], 'scan_dates': []}
+
+def validate_stream(batches, report, top):
+    """Validate VINs batch by batch, keeping only counts and a few examples"""
+    reasons = Counter()
+    examples = []
+    for values in batches:
+        _, batch_reasons, _ = validate_vins(values)
+        for value, reason in zip(values, batch_reasons):
+            if reason is not None:
+                reasons[reason] += 1
+                if len(examples) < top:
+                    examples.append({'vin_value': value, 'reason': reason})
+    report['invalid'] = {'count': sum(reasons.values()), 'reasons': dict(reasons.most_common()),
+                         'examples': examples}
+
+def sqlite_report(conn, top=DEFAULT_TOP, date_bucket='month'):
+    report = empty_report()
+    cursor = conn.cursor()
+    report['total'] = cursor.execute('SELECT COUNT(*) FROM vin_records').fetchone()[0]
+
+    # Duplicates only show up after normalization: vin_value itself is UNIQUE
+    normalized = 'UPPER(TRIM(vin_value))'
+    groups, extra = cursor.execute(f'''
+        SELECT COUNT(*), COALESCE(SUM(n - 1), 0) FROM (
+            SELECT COUNT(*) AS n FROM vin_records GROUP BY {normalized} HAVING n > 1
+        )
+    ''').fetchone()
+    cursor.execute(f'''
+        SELECT {normalized} AS vin, COUNT(*) AS n FROM vin_records
+        GROUP BY vin HAVING n > 1 ORDER BY n DESC, vin LIMIT ?
+    ''', (top,))
+    report['duplicates'] = {'groups': groups, 'extra_records': extra,
+                            'top': [{'vin': vin, 'count': n} for vin, n in cursor]}
+
+    cursor.execute(f'''
+        SELECT SUBSTR({normalized}, 1, 3) AS wmi, COUNT(*) AS n FROM vin_records
+        GROUP BY wmi ORDER BY n DESC, wmi LIMIT ?
+    ''', (top,))
+    report['wmi'] = [{'wmi': wmi, 'count': n} for wmi, n in cursor]
+
+    cursor.execute('''
+        SELECT COALESCE(SUBSTR(scan_date, 1, ?), 'unknown') AS bucket, COUNT(*) FROM vin_records
+        GROUP BY bucket ORDER BY bucket
+    ''', (DATE_BUCKETS[date_bucket],))
+    report['scan_dates'] = [{'bucket': bucket, 'count': n} for bucket, n in cursor]
+
+    def batches():
+        # Streaming cursor: fetchmany keeps one batch in memory at a time
+        stream = conn.cursor()
+        stream.execute('SELECT vin_value FROM vin_records')
+        try:
+            while True:
+                rows = stream.fetchmany(VALIDATION_BATCH_SIZE)
+                if not rows:
+                    break
+                yield [row[0] for row in rows]
+        finally:
+            stream.close()
+
+    validate_stream(batches(), report, top)
+    return report
+
+def sqlite_page(conn, limit, offset):
+    cursor = conn.execute(
+        'SELECT id, vin_value, description, scan_date FROM vin_records ORDER BY id LIMIT ? OFFSET ?',
+        (limit, offset)
+    )
+    return [{'id': row[0], 'vin_value': row[1], 'description': row[2], 'scan_date': row[3]} for row in cursor]
+
+def mongo_report(collection, top=DEFAULT_TOP, date_bucket='month'):
+    """The same report from one $facet aggregation plus a streamed, projected find"""
+    normalized = {'$toUpper': {'$trim': {'input': {'$ifNull': [{'$toString': '$vin_value'}, '']}}}}
+    date_length = DATE_BUCKETS[date_bucket]
+    date_format = {'year': '%Y', 'month': '%Y-%m', 'day': '%Y-%m-%d'}[date_bucket]
+    # scan_date is a date when written by the API and text when migrated from SQLite
+    bucket = {'$switch': {
+        'branches': [
+            {'case': {'$eq': [{'$type': '$scan_date'}, 'date']},
+             'then': {'$dateToString': {'format': date_format, 'date': '$scan_date'}}},
+            {'case': {'$eq': [{'$type': '$scan_date'}, 'string']},
+             'then': {'$substrCP': ['$scan_date', 0, date_length]}}
+        ],
+        'default': 'unknown'
+    }}
+    pipeline = [
+        {'$project': {'_id': 0, 'vin': normalized, 'bucket': bucket}},
+        {'$facet': {
+            'total': [{'$count': 'n'}],
+            # $facet can't nest, so the duplicate groups are counted and ranked separately
+            'duplicate_summary': [
+                {'$group': {'_id': '$vin', 'n': {'$sum': 1}}},
+                {'$match': {'n': {'$gt': 1}}},
+                {'$group': {'_id': None, 'groups': {'$sum': 1}, 'extra': {'$sum': {'$subtract': ['$n', 1]}}}}
+            ],
+            'duplicate_top': [
+                {'$group': {'_id': '$vin', 'n': {'$sum': 1}}},
+                {'$match': {'n': {'$gt': 1}}},
+                {'$sort': {'n': -1, '_id': 1}},
+                {'$limit': top}
+            ],
+            'wmi': [
+                {'$group': {'_id': {'$substrCP': ['$vin', 0, 3]}, 'n': {'$sum': 1}}},
+                {'$sort': {'n': -1, '_id': 1}},
+                {'$limit': top}
+            ],
+            'scan_dates': [
+                {'$group': {'_id': '$bucket', 'n': {'$sum': 1}}},
+                {'$sort': {'_id': 1}}
+            ]
+        }}
+    ]
+    result = next(collection.aggregate(pipeline, allowDiskUse=True))
+
+    report = empty_report()
+    report['total'] = result['total'][0]['n'] if result['total'] else 0
+    summary = result['duplicate_summary'][0] if result['duplicate_summary'] else {'groups': 0, 'extra': 0}
+    report['duplicates'] = {'groups': summary['groups'], 'extra_records': summary['extra'],
+                            'top': [{'vin': item['_id'], 'count': item['n']} for item in result['duplicate_top']]}
+    report['wmi'] = [{'wmi': item['_id'], 'count': item['n']} for item in result['wmi']]
+    report['scan_dates'] = [{'bucket': item['_id'], 'count': item['n']} for item in result['scan_dates']]
+
+    def batches():
+        batch = []
+        for document in collection.find({}, {'_id': 0, 'vin_value': 1}, batch_size=VALIDATION_BATCH_SIZE):
+            batch.append(document.get('vin_value'))
+            if len(batch) >= VALIDATION_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    validate_stream(batches(), report, top)
+    return report
+
+def mongo_page(collection, limit, offset):
+    cursor = collection.find({}, {'_id': 0, 'vin_value': 1, 'description': 1, 'scan_date': 1}) \
+        .sort('_id', 1).skip(offset).limit(limit)
+    return [{'vin_value': doc.get('vin_value'), 'description': doc.get('description'),
+             'scan_date': doc.get('scan_date')} for doc in cursor]
+
+def print_report(report):
+    print(f"\nTotal records in database: {report['total']}")
+
+    duplicates = report['duplicates']
+    print(f"\nDuplicates after normalization: {duplicates['groups']} VINs, "
+          f"{duplicates['extra_records']} extra records")
+    for item in duplicates['top']:
+        print(f"  {item['vin']}: {item['count']}")
+
+    invalid = report['invalid']
+    print(f"\nInvalid VINs: {invalid['count']}")
+    for reason, count in invalid['reasons'].items():
+        print(f"  {reason}: {count}")
+    for item in invalid['examples']:
+        print(f"  e.g. {item['vin_value']!r} ({item['reason']})")
+
+    print("\nTop WMI prefixes:")
+    for item in report['wmi']:
+        print(f"  {item['wmi']}: {item['count']}")
+
+    print("\nRecords by scan date:")
+    for item in report['scan_dates']:
+        print(f"  {item['bucket']}: {item['count']}")
+
+def print_page(records, offset):
+    print(f"\nRecords {offset + 1}-{offset + len(records)}:")
+    for record in records:
+        prefix = f"ID: {record['id']}, " if 'id' in record else ''
+        print(f"{prefix}VIN: {record['vin_value']}, Date: {record['scan_date']}")
+        if record['description']:
+            print(f"  Description: {record['description']}")
+
+def check_database(sqlite_path='vin_database.db', mongo_uri=None, limit=0, offset=0,
+                   top=DEFAULT_TOP, date_bucket='month', as_json=False):
+    """Report on the VIN database; with mongo_uri, on MongoDB instead of SQLite
+
+    limit > 0 also lists that many records starting at offset.
+    """
     try:
-        conn = sqlite3.connect('vin_database.db')
-        cursor = conn.cursor()
-        
-        # Check if table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='vin_records'")
-        if not cursor.fetchone():
-            print("Table 'vin_records' does not exist!")
-            return
-            
-        # Get record count
-        cursor.execute('SELECT COUNT(*) FROM vin_records')
-        count = cursor.fetchone()[0]
-        print(f"\nTotal records in database: {count}")
-        
-        # Show all records
-        cursor.execute('SELECT * FROM vin_records')
-        records = cursor.fetchall()
-        print("\nAll records:")
-        for record in records:
-            print(f"ID: {record[0]}, VIN: {record[1]}, Date: {record[2]}")
-            
+        if mongo_uri:
+            from pymongo import MongoClient
+            client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000, tlsCAFile=certifi.where())
+            collection = client.vin_database.vin_records
+            report = mongo_report(collection, top, date_bucket)
+            records = mongo_page(collection, limit, offset) if limit else []
+        else:
+            conn = sqlite3.connect(sqlite_path)
+            cursor = conn.cursor()
+
+            # Check if table exists
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='vin_records'")
+            if not cursor.fetchone():
+                print("Table 'vin_records' does not exist!")
+                return
+            report = sqlite_report(conn, top, date_bucket)
+            records = sqlite_page(conn, limit, offset) if limit else []
+
+        if as_json:
+            if limit:
+                report['records'] = records
+            print(json.dumps(report, indent=2, default=str))
+        else:
+            print_report(report)
+            if limit:
+                print_page(records, offset)
+
     except Exception as e:
         print(f"Error checking database: {str(e)}")
     finally:
         if 'conn' in locals():
             conn.close()
+        if 'client' in locals():
+            client.close()
 
 if __name__ == "__main__":
-    check_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Report on vin_records in SQLite or MongoDB')
+    parser.add_argument('--sqlite-path', default='vin_database.db')
+    parser.add_argument('--mongo', action='store_true', help='report on MongoDB (MONGO_URI) instead of SQLite')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI'))
+    parser.add_argument('--limit', type=int, default=0, help='also list this many records')
+    parser.add_argument('--offset', type=int, default=0, help='skip this many records when listing')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='rows per histogram/example section')
+    parser.add_argument('--date-bucket', choices=tuple(DATE_BUCKETS), default='month')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+    if args.mongo and not args.mongo_uri:
+        parser.error('--mongo needs MONGO_URI or --mongo-uri')
+    check_database(args.sqlite_path, args.mongo_uri if args.mongo else None, args.limit, args.offset,
+                   args.top, args.date_bucket, args.json)
@@ -0,0 +1,167 @@
+from pymongo import ASCENDING, IndexModel, MongoClient, UpdateOne
+from dotenv import load_dotenv
+import argparse
+import certifi
+import json
+import logging
+import os
+import sys
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Indexes on vin_records:
+# - vin_value_unique backs the upsert filter, enforces one record per VIN and
+#   serves check_vin/check_vins (an equality match, then one document fetch)
+# - scan_date/migrated_at back the incremental refresh of the membership index
+VIN_INDEXES = [
+    IndexModel([('vin_value', ASCENDING)], name='vin_value_unique', unique=True),
+    IndexModel([('scan_date', ASCENDING)], name='scan_date'),
+    IndexModel([('migrated_at', ASCENDING)], name='migrated_at', sparse=True)
+]
+
+# Indexes that earlier versions created and ensure_indexes now drops.
+# vin_lookup_covering (vin_value, description, scan_date) copied every
+# description into a second index, doubling index writes on add_vin, to save
+# one fetch after a unique-index match.
+RETIRED_INDEXES = ('vin_lookup_covering',)
+
+# Projection for the read paths
+VIN_LOOKUP_PROJECTION = {'_id': 0, 'vin_value': 1, 'description': 1, 'scan_date': 1}
+
+# Query and update documents for the API's reads and writes, shared by the
+# sync (storage.py) and async (asgi_app.py) drivers so both stay index-backed
+
+def lookup_filter(vin):
+    return {'vin_value': vin}
+
+def lookup_many_filter(vins):
+    return {'vin_value': {'$in': list(vins)}}
+
+def upsert_update(vin, description, scan_date):
+    """$set for an upsert filtered by lookup_filter(vin)"""
+    return {'$set': {'vin_value': vin, 'description': description, 'scan_date': scan_date}}
+
+def bulk_upsert_operations(records, scan_date):
+    """UpdateOne upserts for {'vin_value', 'description'} records"""
+    return [
+        UpdateOne(
+            lookup_filter(record['vin_value']),
+            upsert_update(record['vin_value'], record['description'], scan_date),
+            upsert=True
+        )
+        for record in records
+    ]
+
+def ensure_indexes(db):
+    """Create missing vin_records indexes and drop retired ones (no-op when up to date)"""
+    names = db.vin_records.create_indexes(VIN_INDEXES)
+    existing = db.vin_records.index_information()
+    for name in RETIRED_INDEXES:
+        if name in existing:
+            db.vin_records.drop_index(name)
+            logger.info(f"Dropped retired vin_records index {name}")
+    logger.info(f"Ensured vin_records indexes: {', '.join(names)}")
+    return names
+
+async def ensure_indexes_async(db):
+    """ensure_indexes for a database from PyMongo's async client"""
+    names = await db.vin_records.create_indexes(VIN_INDEXES)
+    existing = await db.vin_records.index_information()
+    for name in RETIRED_INDEXES:
+        if name in existing:
+            await db.vin_records.drop_index(name)
+            logger.info(f"Dropped retired vin_records index {name}")
+    logger.info(f"Ensured vin_records indexes: {', '.join(names)}")
+    return names
+
+def plan_stages(plan):
+    """All stage names in an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for key, value in plan.items():
+            if key in ('inputStage', 'inputStages', 'queryPlan', 'shards', 'winningPlan'):
+                stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+def winning_plan_stages(explain_result):
+    return plan_stages(explain_result.get('queryPlanner', {}).get('winningPlan', {}))
+
+def check_query_plans(db, sample_vin='00000000000000000'):
+    """Explain the hot vin_records queries and report whether they use the indexes
+
+    Returns a list of {query, stages, ok, problem} dicts. Every query must
+    use an index scan rather than a collection scan.
+    """
+    collection = db.vin_records
+    checks = [
+        (
+            'check_vin find_one',
+            collection.find(lookup_filter(sample_vin), VIN_LOOKUP_PROJECTION).limit(1).explain()
+        ),
+        (
+            'check_vins $in',
+            collection.find(lookup_many_filter([sample_vin, sample_vin[::-1]]), VIN_LOOKUP_PROJECTION).explain()
+        ),
+        (
+            'add_vin upsert filter',
+            db.command(
+                'explain',
+                {
+                    'update': collection.name,
+                    'updates': [{
+                        'q': lookup_filter(sample_vin),
+                        'u': upsert_update(sample_vin, '', None),
+                        'upsert': True
+                    }]
+                },
+                verbosity='queryPlanner'
+            )
+        )
+    ]
+
+    report = []
+    for query, explain_result in checks:
+        stages = winning_plan_stages(explain_result)
+        problem = None
+        if 'COLLSCAN' in stages or not any(stage in ('IXSCAN', 'EXPRESS_IXSCAN', 'IDHACK') for stage in stages):
+            problem = 'not using an index (collection scan)'
+        report.append({'query': query, 'stages': stages, 'ok': problem is None, 'problem': problem})
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage and verify vin_records indexes')
+    parser.add_argument('--ensure', action='store_true', help='create missing indexes')
+    parser.add_argument('--check', action='store_true', help='explain() the hot queries and fail if they stop using the indexes')
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI'))
+    args = parser.parse_args()
+    if not args.ensure and not args.check:
+        args.ensure = args.check = True
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=5000, tlsCAFile=certifi.where())
+    try:
+        db = client.vin_database
+        if args.ensure:
+            ensure_indexes(db)
+        if args.check:
+            report = check_query_plans(db)
+            print(json.dumps(report, indent=2))
+            failures = [item for item in report if not item['ok']]
+            if failures:
+                for item in failures:
+                    logger.error(f"Index self-check FAILED for {item['query']}: {item['problem']} "
+                                 f"(stages: {' -> '.join(item['stages'])})")
+                sys.exit(1)
+            logger.info("Index self-check passed: all hot queries use the vin_records indexes")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
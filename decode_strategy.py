@@ -0,0 +1,140 @@
+import threading
+import time
+import cv2
+from pyzbar.pyzbar import decode as zbar_decode
+from pyzbar.locations import Point, Rect
+
+# Decode strategies for the scanner (t.py, test_scanner.py).
+#
+#   full      pyzbar on the full-resolution colour frame (the original behaviour)
+#   gray      pyzbar on the full-resolution grayscale frame
+#   adaptive  grayscale once per frame, then:
+#             - no code seen recently: decode a downscaled copy, sized so the
+#               last code seen stays about min_code_pixels wide (search_width
+#               wide before the first hit)
+#             - after a hit: decode only a region of interest around the last
+#               polygon, at full resolution, until roi_max_misses misses
+#             - every full_scan_every frames: decode the whole frame at full
+#               resolution, to catch codes the other passes would miss
+#
+# Results are pyzbar Decoded tuples with rect/polygon mapped back to
+# full-frame coordinates, so callers can draw them on the original frame.
+
+STRATEGIES = ('full', 'gray', 'adaptive')
+
+# Pass kinds reported by FrameDecoder.stats()
+FULL = 'full'
+GRAY = 'gray'
+DOWNSCALED = 'downscaled'
+ROI = 'roi'
+FALLBACK = 'fallback'
+
+class FrameDecoder:
+    """Callable frame -> decoded objects; safe to share between decode threads"""
+
+    def __init__(self, strategy='adaptive', search_width=640, min_code_pixels=120,
+                 roi_padding=0.5, roi_max_misses=5, full_scan_every=15, decode=zbar_decode):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown decode strategy {strategy!r}; expected one of {', '.join(STRATEGIES)}")
+        self.strategy = strategy
+        self.search_width = search_width
+        self.min_code_pixels = min_code_pixels
+        self.roi_padding = roi_padding
+        self.roi_max_misses = roi_max_misses
+        self.full_scan_every = full_scan_every
+        self._decode = decode
+        self._lock = threading.Lock()
+        self._frames = 0
+        self._roi = None
+        self._roi_misses = 0
+        self._scale = None
+        self._stats = {}
+
+    def __call__(self, frame):
+        return self.decode(frame)
+
+    def decode(self, frame):
+        if self.strategy == FULL:
+            return self._timed(FULL, frame)
+
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.strategy == GRAY:
+            return self._timed(GRAY, gray)
+
+        height, width = gray.shape[:2]
+        with self._lock:
+            self._frames += 1
+            if self.full_scan_every and self._frames % self.full_scan_every == 0:
+                kind, roi, scale = FALLBACK, None, 1.0
+            elif self._roi is not None:
+                kind, roi, scale = ROI, self._roi, 1.0
+            else:
+                kind, roi = DOWNSCALED, None
+                scale = self._scale or min(1.0, self.search_width / max(width, height))
+
+        if roi is not None:
+            left, top, right, bottom = roi
+            objects = self._timed(kind, gray[top:bottom, left:right], offset=(left, top))
+        elif scale < 1.0:
+            small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            objects = self._timed(kind, small, scale=scale)
+        else:
+            objects = self._timed(kind, gray)
+
+        with self._lock:
+            if objects:
+                self._track(objects, width, height)
+            elif kind == ROI:
+                self._roi_misses += 1
+                if self._roi_misses >= self.roi_max_misses:
+                    # Code left the region: search the whole (downscaled) frame again
+                    self._roi = None
+        return objects
+
+    def _track(self, objects, width, height):
+        """Update the ROI and downscale factor from a hit (called under the lock)"""
+        xs = [point.x for obj in objects for point in obj.polygon]
+        ys = [point.y for obj in objects for point in obj.polygon]
+        if not xs:
+            return
+        code_size = max(max(obj.rect.width, obj.rect.height) for obj in objects)
+        padding = int(self.roi_padding * code_size)
+        self._roi = (max(min(xs) - padding, 0), max(min(ys) - padding, 0),
+                     min(max(xs) + padding, width), min(max(ys) + padding, height))
+        self._roi_misses = 0
+        # Smallest image that still keeps the code about min_code_pixels wide
+        self._scale = min(1.0, self.min_code_pixels / max(code_size, 1))
+
+    def _timed(self, kind, image, scale=1.0, offset=(0, 0)):
+        started = time.perf_counter()
+        objects = self._decode(image)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            calls, hits, seconds = self._stats.get(kind, (0, 0, 0.0))
+            self._stats[kind] = (calls + 1, hits + bool(objects), seconds + elapsed)
+        if scale == 1.0 and offset == (0, 0):
+            return objects
+        return [map_to_frame(obj, scale, offset) for obj in objects]
+
+    def stats(self):
+        """Per pass kind: calls, hits and mean latency in ms"""
+        with self._lock:
+            return {
+                kind: {'calls': calls, 'hits': hits, 'mean_ms': 1000.0 * seconds / calls if calls else 0.0}
+                for kind, (calls, hits, seconds) in self._stats.items()
+            }
+
+def map_to_frame(obj, scale, offset):
+    """Decoded object from a scaled/cropped image, in full-frame coordinates"""
+    dx, dy = offset
+    rect = obj.rect
+    return obj._replace(
+        rect=Rect(int(rect.left / scale) + dx, int(rect.top / scale) + dy,
+                  int(rect.width / scale), int(rect.height / scale)),
+        polygon=[Point(int(point.x / scale) + dx, int(point.y / scale) + dy) for point in obj.polygon]
+    )
+
+def format_decoder_stats(strategy, stats):
+    passes = ', '.join(f"{kind} {item['calls']} x {item['mean_ms']:.1f} ms ({item['hits']} hits)"
+                       for kind, item in sorted(stats.items()))
+    return f"decode strategy {strategy}: {passes or 'no frames'}"
@@ -0,0 +1,167 @@
+from datetime import datetime, timezone
+import glob
+import os
+import time
+import cv2
+
+# Frame sources for the scanner (t.py): a camera index, a video file, or a
+# directory / glob of images. Every source has read() -> (ok, frame) like
+# cv2.VideoCapture, so ScanPipeline can use any of them. For headless batch
+# scans (batch_scan.py) a source is also split into independent tasks that
+# worker processes open and decode on their own, so frames never cross
+# process boundaries.
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+class CameraSource:
+    kind = 'camera'
+
+    def __init__(self, index=0):
+        self.name = f"camera:{index}"
+        self.cap = cv2.VideoCapture(index)
+
+    def read(self):
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+class VideoFileSource:
+    """A video file; with realtime=True, read() is paced to the file's frame rate"""
+
+    kind = 'video'
+
+    def __init__(self, path, realtime=False):
+        self.name = path
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise ValueError(f"Cannot open video {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.realtime = realtime
+        self._next_at = None
+
+    def read(self):
+        if self.realtime:
+            now = time.monotonic()
+            if self._next_at is not None and now < self._next_at:
+                time.sleep(self._next_at - now)
+            self._next_at = max(now, self._next_at or now) + 1.0 / self.fps
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+class ImageSource:
+    """Image files in order; with interval set, read() shows each for that many seconds"""
+
+    kind = 'images'
+
+    def __init__(self, name, paths, interval=0.0):
+        self.name = name
+        self.paths = paths
+        self.interval = interval
+        self._position = 0
+
+    def read(self):
+        if self.interval and self._position:
+            time.sleep(self.interval)
+        # Skip unreadable files
+        while self._position < len(self.paths):
+            frame = cv2.imread(self.paths[self._position])
+            self._position += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def release(self):
+        pass
+
+def image_paths(spec):
+    """Sorted image files in a directory or matching a glob"""
+    if os.path.isdir(spec):
+        paths = [os.path.join(spec, name) for name in os.listdir(spec)]
+    else:
+        paths = glob.glob(spec)
+    return sorted(path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path))
+
+def is_glob(spec):
+    return any(char in spec for char in '*?[')
+
+def open_source(spec, realtime=True):
+    """Camera index ('0'), video file, image file, directory or glob of images"""
+    if str(spec).isdigit():
+        return CameraSource(int(spec))
+    if os.path.isdir(spec) or is_glob(spec) or spec.lower().endswith(IMAGE_EXTENSIONS):
+        paths = image_paths(spec) if not os.path.isfile(spec) else [spec]
+        if not paths:
+            raise ValueError(f"No images found for {spec}")
+        return ImageSource(spec, paths, interval=0.5 if realtime else 0.0)
+    if not os.path.exists(spec):
+        raise ValueError(f"No such camera, video or image source: {spec}")
+    return VideoFileSource(spec, realtime=realtime)
+
+def plan_tasks(spec, segment_frames=900, images_per_task=50):
+    """Split a file-based source into tasks for batch_scan workers
+
+    Videos become ('video', path, start_frame, end_frame, fps) segments; images
+    become ('images', spec, [paths]) chunks. Cameras can't be split.
+    """
+    if str(spec).isdigit():
+        raise ValueError("Camera sources can't be batch-processed; record to a file first")
+    if os.path.isdir(spec) or is_glob(spec) or spec.lower().endswith(IMAGE_EXTENSIONS):
+        paths = image_paths(spec) if not os.path.isfile(spec) else [spec]
+        if not paths:
+            raise ValueError(f"No images found for {spec}")
+        return [('images', spec, paths[start:start + images_per_task])
+                for start in range(0, len(paths), images_per_task)]
+
+    cap = cv2.VideoCapture(spec)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video {spec}")
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    finally:
+        cap.release()
+    if frame_count <= 0:
+        # Unknown length (some containers): one task reads to the end
+        return [('video', spec, 0, None, fps)]
+    return [('video', spec, start, min(start + segment_frames, frame_count), fps)
+            for start in range(0, frame_count, segment_frames)]
+
+def task_frames(task, stride=1):
+    """Yield (frame_index, offset_seconds, captured_at, frame) for one task
+
+    offset_seconds is the position in a video (None for images);
+    captured_at is an image's modification time (None for videos).
+    Every stride-th frame is decoded; the others are only grabbed.
+    """
+    if task[0] == 'images':
+        _, _, paths = task
+        for path in paths:
+            frame = cv2.imread(path)
+            if frame is None:
+                continue
+            mtime = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+            yield path, None, mtime.isoformat(), frame
+        return
+
+    _, path, start, end, fps = task
+    cap = cv2.VideoCapture(path)
+    try:
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        index = start
+        while end is None or index < end:
+            if (index - start) % stride:
+                if not cap.grab():
+                    break
+            else:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield index, index / fps, None, frame
+            index += 1
+    finally:
+        cap.release()
@@ -0,0 +1,52 @@
+import os
+
+# Production gunicorn profile for app.py (render.yaml: gunicorn -c gunicorn.conf.py app:app)
+#
+# The app is preloaded in the master so workers fork fast; post_fork then
+# gives each worker its own MongoDB client and warms its pool (app.init_worker).
+# Every setting can be tuned from the environment.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '8')) if worker_class == 'gthread' else 1
+# Concurrent requests per gevent/eventlet worker (greenlets, not threads)
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+async_worker = worker_class in ('gevent', 'eventlet')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+# Read by app.py when it is imported, which with preload_app happens after this file runs.
+# One request per thread only holds for sync/gthread workers: an async worker
+# runs up to worker_connections greenlets on one thread, so a pool sized from
+# GUNICORN_THREADS would queue them all behind a couple of connections. Those
+# workers get the driver's default pool unless MONGO_MAX_POOL_SIZE is set.
+if async_worker:
+    os.environ.pop('GUNICORN_THREADS', None)
+else:
+    os.environ['GUNICORN_THREADS'] = str(threads)
+if preload_app:
+    os.environ['APP_INIT_AFTER_FORK'] = 'true'
+
+# Connections Atlas allows for this service; workers x maxPoolSize above it is logged
+MONGO_MAX_CONNECTIONS = int(os.getenv('MONGO_MAX_CONNECTIONS', '500'))
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from app import MONGO_POOL_OPTIONS
+    max_pool = MONGO_POOL_OPTIONS.get('maxPoolSize', 100)
+    total = server.cfg.workers * max_pool
+    concurrency = f"{worker_connections} connections" if async_worker else f"{threads} threads"
+    server.log.info(f"{server.cfg.workers} {worker_class} workers x {concurrency}, MongoDB pool "
+                    f"{MONGO_POOL_OPTIONS.get('minPoolSize', 0)}-{max_pool} per worker ({total} connections max)")
+    if total > MONGO_MAX_CONNECTIONS:
+        server.log.warning(f"Up to {total} MongoDB connections exceeds MONGO_MAX_CONNECTIONS={MONGO_MAX_CONNECTIONS}; "
+                           "lower WEB_CONCURRENCY, GUNICORN_THREADS or MONGO_MAX_POOL_SIZE")
+
+def post_fork(server, worker):
+    if preload_app:
+        from app import init_worker
+        init_worker()
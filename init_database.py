@@ -6,8 +6,26 @@ import pyodbc
 import pandas as pd
 import os
 import csv
-from io import StringIO
 import re
+import io
+import tempfile
+import argparse
+import glob
+import multiprocessing
+import queue
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from vin_validation import EMPTY, VIN_LENGTH, validate_vin, validate_vins
+
+# Rows per executemany call while importing
+IMPORT_BATCH_SIZE = 5000
+PROGRESS_INTERVAL = 50000
+# Column holding the free-text description a VIN is extracted from
+DEFAULT_COLUMN = 'Description'
+# Delimiters between the tokens of a description that may hold a VIN
+VIN_TOKEN_SEPARATORS = r'[,;\s]+'
 
 def try_pyodbc_connection():
     """Try to connect using pyodbc with different drivers"""
@@ -61,27 +79,280 @@ def try_pandas_connection():
         print(f"Pandas connection failed: {str(e)}")
     return None
 
-def extract_vin(text):
-    """Extract any sequence as a potential VIN from text"""
+def extract_vin(text, check_digit=True):
+    """Return the first valid VIN among the tokens of text, or None"""
     if not text:
         return None
-    
-    # Convert to uppercase and clean the text
-    text = str(text).upper().strip()
-    
-    # Split by common delimiters and take the first non-empty part
-    parts = re.split(r'[,;\s]+', text)
-    for part in parts:
-        if part:  # Return first non-empty part
-            return part
-    
+
+    # Split by common delimiters and check each part
+    for part in re.split(VIN_TOKEN_SEPARATORS, str(text)):
+        vin, reason = validate_vin(part, check_digit)
+        if reason is None:
+            return vin
+
     return None
 
-def init_database():
-    """Initialize SQLite database with VIN-like sequences from descriptions"""
+def extract_vins(descriptions, check_digit=True):
+    """Pick a VIN from each description in one vectorized pass
+
+    Every token of every description is validated together. A row gets its
+    first valid token; a row without one gets the rejection reason of its
+    first 17-character token, or else of its first token. Returns (vins,
+    reasons) arrays aligned with descriptions, reason None where a VIN was
+    found.
+    """
+    series = pd.Series(list(descriptions), dtype=object).fillna('')
+    tokens = series.str.split(VIN_TOKEN_SEPARATORS, regex=True).explode()
+    tokens = tokens[tokens.str.len() > 0]
+    vins, reasons, _ = validate_vins(tokens.to_numpy(), check_digit)
+
+    # Rank valid tokens first, then 17-character ones, whose reason says the most
+    rank = np.where(pd.isna(reasons), 0, np.where(np.char.str_len(vins) == VIN_LENGTH, 1, 2))
+    candidates = pd.DataFrame({'row': tokens.index.to_numpy(), 'rank': rank, 'token': np.arange(len(vins))})
+    # Stable sort keeps token order within a rank
+    best = candidates.sort_values(['row', 'rank'], kind='stable').drop_duplicates('row')
+    rows = best['row'].to_numpy()
+    picked = best['token'].to_numpy()
+
+    row_vins = np.full(len(series), '', dtype=object)
+    row_reasons = np.full(len(series), EMPTY, dtype=object)
+    row_vins[rows] = vins[picked]
+    row_reasons[rows] = reasons[picked]
+    return row_vins, row_reasons
+
+def export_rows(accdb_path, table):
+    """Yield the rows of an Access table as dicts, streamed from mdb-export
+
+    stdout is read incrementally, so memory use does not grow with the table.
+    stderr goes to a temporary file so a chatty mdb-export can't fill its pipe
+    and stall. Raises RuntimeError if mdb-export fails.
+    """
+    with tempfile.TemporaryFile() as stderr:
+        export_process = subprocess.Popen(['mdb-export', accdb_path, table],
+                                          stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            stdout = io.TextIOWrapper(export_process.stdout, encoding='utf-8', errors='replace', newline='')
+            yield from csv.DictReader(stdout)
+        finally:
+            export_process.stdout.close()
+            returncode = export_process.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"mdb-export exited with {returncode}: {stderr.read().decode(errors='replace').strip()}")
+
+def validate_batch(descriptions, check_digit=True):
+    """(vin_value, description) rows for the valid VINs, plus a Counter of rejection reasons"""
+    vins, reasons = extract_vins(descriptions, check_digit)
+    rows = [(vin, description) for vin, reason, description in zip(vins, reasons, descriptions)
+            if reason is None]
+    return rows, Counter(reason for reason in reasons if reason is not None)
+
+def parse_source(accdb_path, table, column, batch_size=IMPORT_BATCH_SIZE, check_digit=True):
+    """Yield (rows_read, batch, rejected) from one table
+
+    batch holds (vin_value, description) rows that passed validation and
+    rejected counts the other descriptions by reason. column is matched
+    case-insensitively. batch may be empty on the progress-only yields every
+    PROGRESS_INTERVAL rows.
+    """
+    descriptions = []
+    rows_read = 0
+    key = None
+    for row in export_rows(accdb_path, table):
+        rows_read += 1
+        if key is None:
+            key = next((name for name in row if name and name.lower() == column.lower()), column)
+        description = row.get(key)
+        if description:
+            descriptions.append(description)
+        if len(descriptions) >= batch_size:
+            yield (rows_read, *validate_batch(descriptions, check_digit))
+            descriptions = []
+        elif rows_read % PROGRESS_INTERVAL == 0:
+            yield rows_read, [], Counter()
+    yield (rows_read, *validate_batch(descriptions, check_digit))
+
+def expand_sources(patterns, tables):
+    """Expand Access file globs into one source per (file, table) pair
+
+    tables are 'Table' or 'Table:Column' specs; the column defaults to
+    DEFAULT_COLUMN. Patterns that match nothing are reported and skipped.
+    """
+    mappings = []
+    for spec in tables:
+        table, _, column = spec.partition(':')
+        mappings.append((table, column or DEFAULT_COLUMN))
+
+    sources = []
+    seen = set()
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern))
+        if not paths:
+            print(f"No Access files match {pattern}")
+        for path in paths:
+            for table, column in mappings:
+                if (path, table, column) not in seen:
+                    seen.add((path, table, column))
+                    sources.append({'path': path, 'table': table, 'column': column})
+    return sources
+
+def source_name(source):
+    return f"{source['path']}:{source['table']}.{source['column']}"
+
+# Set in each pool process by _init_worker
+_result_queue = None
+_stop_event = None
+
+def _init_worker(result_queue, stop_event):
+    global _result_queue, _stop_event
+    _result_queue = result_queue
+    _stop_event = stop_event
+
+def _put(message):
+    """Put on the bounded result queue; returns False once the writer has given up"""
+    while not _stop_event.is_set():
+        try:
+            _result_queue.put(message, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _export_worker(index, source, batch_size, check_digit):
+    """Pool task: export and parse one source, sending batches to the writer"""
+    started = time.monotonic()
+    rows_read = 0
+    error = None
     try:
+        for rows_read, batch, rejected in parse_source(source['path'], source['table'], source['column'],
+                                                       batch_size, check_digit):
+            if not _put(('rows', index, rows_read, (batch, rejected))):
+                return
+    except Exception as e:
+        error = str(e)
+    _put(('done', index, rows_read, {'export_seconds': time.monotonic() - started, 'error': error}))
+
+def _serial_messages(sources, batch_size, check_digit):
+    """The worker protocol run in-process, for a single source or worker"""
+    for index, source in enumerate(sources):
+        started = time.monotonic()
+        rows_read = 0
+        error = None
+        try:
+            for rows_read, batch, rejected in parse_source(source['path'], source['table'], source['column'],
+                                                           batch_size, check_digit):
+                yield 'rows', index, rows_read, (batch, rejected)
+        except Exception as e:
+            error = str(e)
+        yield 'done', index, rows_read, {'export_seconds': time.monotonic() - started, 'error': error}
+
+def _pooled_messages(sources, workers, batch_size, check_digit):
+    """Run _export_worker for every source in a process pool and yield its messages
+
+    The result queue is bounded, so a slow writer holds the exporters back
+    instead of letting parsed rows pile up in memory.
+    """
+    context = multiprocessing.get_context()
+    result_queue = context.Queue(maxsize=workers * 4)
+    stop_event = context.Event()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=_init_worker, initargs=(result_queue, stop_event))
+    try:
+        futures = [pool.submit(_export_worker, index, source, batch_size, check_digit)
+                   for index, source in enumerate(sources)]
+        remaining = len(sources)
+        while remaining:
+            try:
+                message = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                # A worker that died outright (e.g. killed) never sends 'done'
+                for future in futures:
+                    if future.done() and future.exception():
+                        raise RuntimeError(f"Import worker failed: {future.exception()}")
+                continue
+            if message[0] == 'done':
+                remaining -= 1
+            yield message
+    finally:
+        stop_event.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def import_sources(sqlite_conn, sources, workers=None, batch_size=IMPORT_BATCH_SIZE, check_digit=True):
+    """Import every source into vin_records through this one connection
+
+    Sources are exported and parsed in a process pool of up to workers
+    processes (one per CPU by default); this process is the only SQLite
+    writer. INSERT OR IGNORE on the unique vin_value dedupes across sources,
+    so a VIN found in several sources is credited to whichever is written
+    first. Descriptions without a valid VIN are counted per rejection
+    reason instead of being stored. Returns a list of per-source stats dicts.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(sources))
+    if workers > 1:
+        messages = _pooled_messages(sources, workers, batch_size, check_digit)
+    else:
+        messages = _serial_messages(sources, batch_size, check_digit)
+
+    insert_sql = 'INSERT OR IGNORE INTO vin_records (vin_value, description) VALUES (?, ?)'
+    stats = [{'source': source_name(source), 'rows_read': 0, 'extracted': 0, 'inserted': 0,
+              'duplicates': 0, 'rejected': Counter(), 'export_seconds': None, 'error': None}
+             for source in sources]
+    rows_read = 0
+    next_report = PROGRESS_INTERVAL
+    with sqlite_conn:
+        for kind, index, source_rows, payload in messages:
+            source_stats = stats[index]
+            rows_read += source_rows - source_stats['rows_read']
+            source_stats['rows_read'] = source_rows
+            if kind == 'rows':
+                batch, rejected = payload
+                source_stats['rejected'].update(rejected)
+                if batch:
+                    before = sqlite_conn.total_changes
+                    sqlite_conn.executemany(insert_sql, batch)
+                    source_stats['extracted'] += len(batch)
+                    source_stats['inserted'] += sqlite_conn.total_changes - before
+            else:
+                source_stats.update(payload)
+                source_stats['duplicates'] = source_stats['extracted'] - source_stats['inserted']
+                if payload['error']:
+                    print(f"Error exporting {source_stats['source']}: {payload['error']}")
+            if rows_read >= next_report:
+                next_report = rows_read + PROGRESS_INTERVAL
+                print(f"Read {rows_read} rows, inserted {sum(s['inserted'] for s in stats)}")
+    return stats
+
+def print_report(stats, elapsed):
+    print(f"\n{'Source':<50} {'Rows':>10} {'VINs':>10} {'Inserted':>10} {'Dupes':>8} {'Rejected':>9} {'Seconds':>8}")
+    for item in stats:
+        seconds = f"{item['export_seconds']:.1f}" if item['export_seconds'] is not None else '-'
+        line = (f"{item['source']:<50} {item['rows_read']:>10} {item['extracted']:>10} "
+                f"{item['inserted']:>10} {item['duplicates']:>8} {sum(item['rejected'].values()):>9} {seconds:>8}")
+        print(f"{line}  FAILED: {item['error']}" if item['error'] else line)
+    rejected = sum((item['rejected'] for item in stats), Counter())
+    if rejected:
+        print("Rejected: " + ", ".join(f"{reason} {count}" for reason, count in rejected.most_common()))
+    total_rows = sum(item['rows_read'] for item in stats)
+    rate = total_rows / elapsed if elapsed else 0.0
+    print(f"Total: {total_rows} rows, {sum(item['inserted'] for item in stats)} VINs inserted "
+          f"in {elapsed:.1f}s ({rate:.0f} rows/s)")
+
+def init_database(sources=None, workers=None, sqlite_path='vin_database.db', batch_size=IMPORT_BATCH_SIZE,
+                  check_digit=True):
+    """Initialize SQLite database with VIN-like sequences from descriptions
+
+    sources is a list of {'path', 'table', 'column'} dicts (see
+    expand_sources); the default is the Description column of dave.accdb's
+    Job table. check_digit=False also accepts VINs without a valid
+    position 9 check digit (non-North American vehicles).
+    """
+    try:
+        sources = sources or [{'path': 'dave.accdb', 'table': 'Job', 'column': DEFAULT_COLUMN}]
+
         # Create SQLite database
-        sqlite_conn = sqlite3.connect('vin_database.db')
+        sqlite_conn = sqlite3.connect(sqlite_path)
+        sqlite_conn.execute('PRAGMA journal_mode=WAL')
+        sqlite_conn.execute('PRAGMA synchronous=NORMAL')
         sqlite_cursor = sqlite_conn.cursor()
         
         # Drop existing table if it exists
@@ -97,49 +368,16 @@ def init_database():
             )
         ''')
 
-        print("\nExtracting values from Job table descriptions...")
-        
-        # Export Job table
-        export_cmd = ['mdb-export', 'dave.accdb', 'Job']
-        export_process = subprocess.Popen(export_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        csv_output, error = export_process.communicate()
-        
-        if error:
-            print(f"Error exporting data: {error.decode()}")
+        print(f"\nExtracting values from {len(sources)} source(s)...")
+        started = time.monotonic()
+        stats = import_sources(sqlite_conn, sources, workers, batch_size, check_digit)
+        print_report(stats, time.monotonic() - started)
+        if all(item['error'] for item in stats):
             return
-            
-        # Parse CSV data
-        csv_data = StringIO(csv_output.decode())
-        reader = csv.DictReader(csv_data)
-        
-        # Import values
-        count = 0
-        for row in reader:
-            try:
-                description = row.get('Description') or row.get('description')
-                if description:
-                    print(f"\nChecking description: {description}")
-                    value = extract_vin(description)
-                    if value:
-                        sqlite_cursor.execute(
-                            'INSERT OR IGNORE INTO vin_records (vin_value, description) VALUES (?, ?)', 
-                            (value, description)
-                        )
-                        count += 1
-                        print(f"Found value: {value}")
-                        print(f"From description: {description}")
-                    else:
-                        print("No value found in this description")
-            except Exception as e:
-                print(f"Error processing row: {str(e)}")
-                continue
 
-        sqlite_conn.commit()
-        print(f"\nSuccessfully imported {count} values")
-        
-        # Show what was imported
-        print("\nImported values:")
-        sqlite_cursor.execute('SELECT * FROM vin_records')
+        # Show a sample of what was imported
+        print("\nSample of imported values:")
+        sqlite_cursor.execute('SELECT * FROM vin_records LIMIT 5')
         for row in sqlite_cursor.fetchall():
             print(f"ID: {row[0]}, Value: {row[1]}")
             print(f"From description: {row[2]}")
@@ -152,4 +390,18 @@ def init_database():
             sqlite_conn.close()
 
 if __name__ == "__main__":
-    init_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Build vin_database.db from the descriptions in Access files')
+    parser.add_argument('--source', action='append',
+                        help='Access file or glob, e.g. "offices/*.accdb" (repeatable; default dave.accdb)')
+    parser.add_argument('--table', action='append',
+                        help=f'TABLE or TABLE:COLUMN to read from every source (repeatable; default Job:{DEFAULT_COLUMN})')
+    parser.add_argument('--workers', type=int, help='export/parse processes (default: one per CPU)')
+    parser.add_argument('--sqlite-path', default='vin_database.db')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument('--no-check-digit', action='store_true',
+                        help='accept VINs whose position 9 check digit does not match (non-North American)')
+    args = parser.parse_args()
+    sources = expand_sources(args.source or ['dave.accdb'], args.table or ['Job'])
+    if not sources:
+        sys.exit("No sources to import")
+    init_database(sources, args.workers, args.sqlite_path, args.batch_size, not args.no_check_digit)
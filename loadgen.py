@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import requests
+
+load_dotenv()
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (milliseconds) for one run
+
+    rps only counts successful requests, so a server that fails fast doesn't
+    look faster; attempted_rps includes the errors.
+    """
+    latencies = sorted(latencies)
+    total = len(latencies) + errors
+    return {
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'duration_s': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'attempted_rps': round(total / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else None
+    }
+
+def run_load(make_request, concurrency=16, duration=10.0, max_requests=None):
+    """Drive make_request(session, rng) from `concurrency` threads
+
+    make_request returns True when the response counts as a success. Runs
+    for `duration` seconds, or until `max_requests` have been sent.
+    """
+    deadline = time.perf_counter() + duration
+    remaining = [max_requests] if max_requests else None
+    remaining_lock = threading.Lock()
+
+    def take_slot():
+        if remaining is None:
+            return True
+        with remaining_lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(seed):
+        # Per-thread state only; results are merged once the run is over
+        session = requests.Session()
+        rng = random.Random(seed)
+        latencies = []
+        errors = 0
+        while time.perf_counter() < deadline and take_slot():
+            started = time.perf_counter()
+            try:
+                ok = make_request(session, rng)
+            except requests.RequestException:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+        session.close()
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for thread_latencies, _ in outcomes for latency in thread_latencies]
+    errors = sum(thread_errors for _, thread_errors in outcomes)
+    return summarize(latencies, errors, elapsed)
+
+def check_vin_request(base_url, api_key, vins, timeout=10.0):
+    """make_request for GET /api/check_vin over a list of VINs"""
+    url = f"{base_url.rstrip('/')}/api/check_vin"
+    headers = {'X-API-Key': api_key}
+
+    def make_request(session, rng):
+        response = session.get(url, params={'vin': rng.choice(vins)}, headers=headers, timeout=timeout)
+        return response.status_code == 200
+
+    return make_request
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare check_vin throughput and latency across API deployments, '
+                    'e.g. the Flask app (gunicorn app:app) and the ASGI app (uvicorn asgi_app:app)'
+    )
+    parser.add_argument('--target', action='append', required=True,
+                        help='name=base_url, repeat for each server to compare')
+    parser.add_argument('--vins-file', help='file with one VIN per line to look up')
+    parser.add_argument('--vin', action='append', default=[], help='VIN to look up (repeatable)')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=3.0, help='seconds of untimed load before each run')
+    parser.add_argument('--api-key', default=os.getenv('API_KEY'))
+    args = parser.parse_args()
+
+    vins = list(args.vin)
+    if args.vins_file:
+        with open(args.vins_file) as f:
+            vins.extend(line.strip() for line in f if line.strip())
+    if not vins:
+        parser.error('provide --vin or --vins-file')
+
+    report = {'concurrency': args.concurrency, 'duration_s': args.duration, 'targets': {}}
+    for target in args.target:
+        name, sep, base_url = target.partition('=')
+        if not sep:
+            name = base_url = target
+        make_request = check_vin_request(base_url, args.api_key, vins)
+        if args.warmup:
+            run_load(make_request, args.concurrency, args.warmup)
+        report['targets'][name] = run_load(make_request, args.concurrency, args.duration)
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
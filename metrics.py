@@ -0,0 +1,209 @@
+from bisect import bisect_left
+from pymongo import monitoring
+import threading
+import weakref
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Shard:
+    """Metric values recorded by a single thread"""
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+class Metrics:
+    """Prometheus-style counters, gauges and histograms that are cheap to update
+
+    Every thread writes to its own shard, so the request path never takes a
+    lock; shards are only summed when /metrics is scraped. Shards of finished
+    threads are folded into a retired shard so short-lived threads don't pile
+    up. Values are per process: each gunicorn worker reports its own.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.help = {}
+        self.types = {}
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+
+    def describe(self, name, metric_type, help_text):
+        self.types[name] = metric_type
+        self.help[name] = help_text
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+            weakref.finalize(threading.current_thread(), self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            if shard in self._shards:
+                self._shards.remove(shard)
+                self._merge(self._retired, shard)
+
+    @staticmethod
+    def _merge(target, shard):
+        for key, value in shard.counters.items():
+            target.counters[key] = target.counters.get(key, 0) + value
+        for key, value in shard.gauges.items():
+            target.gauges[key] = target.gauges.get(key, 0) + value
+        for key, (counts, total) in shard.histograms.items():
+            if key in target.histograms:
+                target_counts, target_total = target.histograms[key]
+                target.histograms[key] = [[a + b for a, b in zip(target_counts, counts)], target_total + total]
+            else:
+                target.histograms[key] = [list(counts), total]
+
+    def inc(self, name, labels=(), amount=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def add_gauge(self, name, labels=(), amount=1):
+        """Adjust a gauge that is the sum over threads (e.g. in-flight requests)"""
+        gauges = self._shard().gauges
+        key = (name, labels)
+        gauges[key] = gauges.get(key, 0) + amount
+
+    def observe(self, name, labels, seconds):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        entry = histograms.get(key)
+        if entry is None:
+            entry = histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, seconds)] += 1
+        entry[1] += seconds
+
+    def snapshot(self):
+        combined = _Shard()
+        with self._lock:
+            self._merge(combined, self._retired)
+            for shard in self._shards:
+                # Copy first: the owning thread may be adding keys meanwhile
+                copy = _Shard()
+                copy.counters = dict(shard.counters)
+                copy.gauges = dict(shard.gauges)
+                copy.histograms = {key: [list(counts), total] for key, (counts, total) in list(shard.histograms.items())}
+                self._merge(combined, copy)
+        return combined
+
+    def render(self):
+        """Metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        series = {}
+        for (name, labels), value in snapshot.counters.items():
+            series.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), value in snapshot.gauges.items():
+            series.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), (counts, total) in snapshot.histograms.items():
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+        output = []
+        for name in sorted(series):
+            if name in self.help:
+                output.append(f"# HELP {name} {self.help[name]}")
+                output.append(f"# TYPE {name} {self.types[name]}")
+            output.extend(sorted(series[name]))
+        return '\n'.join(output) + '\n'
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return '{' + pairs + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Per-command MongoDB latency, reported by the driver after each command"""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.registry.observe('mongodb_command_duration_seconds',
+                              (('command', event.command_name), ('outcome', 'success')),
+                              event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.registry.observe('mongodb_command_duration_seconds',
+                              (('command', event.command_name), ('outcome', 'failure')),
+                              event.duration_micros / 1e6)
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection-pool checkout wait time and pool churn"""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def connection_checked_out(self, event):
+        self.registry.observe('mongodb_pool_checkout_wait_seconds', (('outcome', 'success'),), event.duration)
+
+    def connection_check_out_failed(self, event):
+        self.registry.observe('mongodb_pool_checkout_wait_seconds', (('outcome', 'failure'),), event.duration)
+        self.registry.inc('mongodb_pool_checkout_failures_total', (('reason', str(event.reason)),))
+
+    def connection_created(self, event):
+        self.registry.inc('mongodb_pool_connections_created_total')
+
+    def connection_closed(self, event):
+        self.registry.inc('mongodb_pool_connections_closed_total')
+
+    # Remaining pool events are not tracked
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+# Process-wide registry used by app.py and asgi_app.py
+registry = Metrics()
+registry.describe('http_requests_total', 'counter', 'HTTP requests by route, method and status code')
+registry.describe('http_request_duration_seconds', 'histogram', 'HTTP request latency by route, method and status code')
+registry.describe('http_requests_in_flight', 'gauge', 'HTTP requests currently being served, by route')
+registry.describe('mongodb_command_duration_seconds', 'histogram', 'MongoDB command latency by command name')
+registry.describe('mongodb_pool_checkout_wait_seconds', 'histogram', 'Time spent waiting to check a connection out of the pool')
+registry.describe('mongodb_pool_checkout_failures_total', 'counter', 'Failed connection checkouts by reason')
+registry.describe('mongodb_pool_connections_created_total', 'counter', 'Pool connections opened')
+registry.describe('mongodb_pool_connections_closed_total', 'counter', 'Pool connections closed')
+registry.describe('mongodb_retries_total', 'counter', 'Retries made by retry_with_backoff')
+
+command_listener = MongoCommandMetrics(registry)
+pool_listener = MongoPoolMetrics(registry)
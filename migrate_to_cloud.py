@@ -1,10 +1,16 @@
 import sqlite3
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, errors
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+import argparse
 import certifi
+import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db_schema import ensure_indexes
 
 load_dotenv()
 
@@ -14,8 +20,308 @@ MONGO_URI = os.getenv('MONGO_URI')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def migrate_to_mongodb():
-    """Migrate VIN records from SQLite to MongoDB Atlas"""
+DEFAULT_CHECKPOINT = 'migration_checkpoint.json'
+
+def empty_checkpoint(source):
+    return {'last_id': 0, 'last_vin': None, 'migrated': 0, 'source': source}
+
+def read_checkpoint(path, source):
+    """Return the saved checkpoint, or an empty one if there is none"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return empty_checkpoint(source)
+
+def source_fingerprint(sqlite_conn, sqlite_path):
+    """Identify the vin_records table a checkpoint was taken from
+
+    init_database.py drops and recreates the table, which restarts the
+    AUTOINCREMENT ids, so a saved id only means something for the same file
+    and the same first row.
+    """
+    row = sqlite_conn.execute('SELECT id, vin_value FROM vin_records ORDER BY id LIMIT 1').fetchone()
+    return {
+        'path': os.path.abspath(sqlite_path),
+        'first_id': row[0] if row else None,
+        'first_vin': row[1] if row else None
+    }
+
+def row_vin(sqlite_conn, row_id):
+    row = sqlite_conn.execute('SELECT vin_value FROM vin_records WHERE id = ?', (row_id,)).fetchone()
+    return row[0] if row else None
+
+def checkpoint_matches(sqlite_conn, checkpoint, source):
+    """True if every saved position still points at the row it was taken at"""
+    if not checkpoint['last_id'] and not checkpoint.get('ranges'):
+        return True
+    if checkpoint.get('source') != source:
+        return False
+    anchors = [(checkpoint['last_id'], checkpoint.get('last_vin'))]
+    for id_range in checkpoint.get('ranges', []):
+        anchors += [(id_range['last_id'], id_range.get('last_vin')), (id_range['end_id'], id_range.get('end_vin'))]
+    return all(vin is None or row_vin(sqlite_conn, row_id) == vin for row_id, vin in anchors)
+
+def advance(position, rows, failed_ids):
+    """Move position['last_id'] over a written batch, stopping below the first failed row
+
+    Once a row has failed the position stays put for the rest of the run, so
+    the next run retries it. Rows after it are sent again, which is harmless
+    since every write is an upsert.
+    """
+    if position.get('failed_id') is not None:
+        return
+    if failed_ids:
+        position['failed_id'] = min(failed_ids)
+        rows = [row for row in rows if row[0] < position['failed_id']]
+    if rows:
+        position['last_id'], position['last_vin'] = rows[-1][0], rows[-1][1]
+
+def write_checkpoint(path, checkpoint):
+    """Save the checkpoint atomically so a crash never leaves a half-written file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def build_operations(rows, migrated_at):
+    """Upserts for (id, vin_value, description, scan_date) rows"""
+    return [
+        UpdateOne(
+            {'vin_value': vin_value},
+            {'$set': {
+                'vin_value': vin_value,
+                'description': description,
+                'scan_date': scan_date,
+                'migrated_at': migrated_at
+            }},
+            upsert=True
+        )
+        for _, vin_value, description, scan_date in rows
+    ]
+
+def write_batch(collection, rows):
+    """Send one unordered bulk_write; returns (written count, ids of failed rows)
+
+    Per-document failures are logged and reported back so the checkpoint can
+    stop below them. Connection errors propagate, leaving the checkpoint at
+    the last fully written batch.
+    """
+    try:
+        collection.bulk_write(build_operations(rows, datetime.utcnow()), ordered=False)
+        return len(rows), []
+    except errors.BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+        for error in write_errors[:5]:
+            logger.error(f"Failed to migrate VIN {rows[error['index']][1]}: {error.get('errmsg')}")
+        if len(write_errors) > 5:
+            logger.error(f"... and {len(write_errors) - 5} more failures in this batch")
+        return len(rows) - len(write_errors), [rows[error['index']][0] for error in write_errors]
+
+class RateLimiter:
+    """Token bucket shared by all workers, in records per second"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, count):
+        """Block until count records may be sent"""
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Going into debt lets batches larger than one second's budget through
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class Progress:
+    """Periodic throughput/ETA reporting instead of a line per record"""
+
+    def __init__(self, total, interval=5.0):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.reported = None
+        self.lock = threading.Lock()
+
+    def update(self, written, failed, force=False):
+        with self.lock:
+            self.done += written + failed
+            self.failed += failed
+            now = time.monotonic()
+            if (force and self.reported != self.done) or now - self.last_report >= self.interval:
+                self.last_report = now
+                self.reported = self.done
+                logger.info(self.summary())
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = max(self.total - self.done, 0)
+        eta = f"{remaining / rate:.0f}s" if rate else "unknown"
+        percent = 100.0 * self.done / self.total if self.total else 100.0
+        return (f"Migrated {self.done}/{self.total} records ({percent:.1f}%), "
+                f"{self.failed} failed, {rate:.0f} records/s, ETA {eta}")
+
+def migrate_range(sqlite_path, collection, after_id, end_id, batch_size, limiter, on_batch):
+    """Stream rows with after_id < id <= end_id (no upper bound if end_id is None)
+
+    Uses its own SQLite connection so ranges can run on separate threads.
+    on_batch(rows, written, failed_ids) is called after every batch.
+    """
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    sqlite_cursor = sqlite_conn.cursor()
+    try:
+        if end_id is None:
+            sqlite_cursor.execute(
+                'SELECT id, vin_value, description, scan_date FROM vin_records WHERE id > ? ORDER BY id',
+                (after_id,)
+            )
+        else:
+            sqlite_cursor.execute(
+                'SELECT id, vin_value, description, scan_date FROM vin_records '
+                'WHERE id > ? AND id <= ? ORDER BY id',
+                (after_id, end_id)
+            )
+        while True:
+            rows = sqlite_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            limiter.acquire(len(rows))
+            written, failed_ids = write_batch(collection, rows)
+            on_batch(rows, written, failed_ids)
+    finally:
+        # Close the cursor first: a half-read SELECT otherwise keeps its read lock
+        sqlite_cursor.close()
+        sqlite_conn.close()
+
+def plan_ranges(sqlite_path, after_id, workers):
+    """Split the ids above after_id into contiguous ranges of similar row counts"""
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    try:
+        sqlite_cursor = sqlite_conn.cursor()
+        sqlite_cursor.execute('SELECT COUNT(*), MAX(id) FROM vin_records WHERE id > ?', (after_id,))
+        count, max_id = sqlite_cursor.fetchone()
+        if not count:
+            return []
+
+        ranges = []
+        start, start_vin = after_id, row_vin(sqlite_conn, after_id)
+        per_range = -(-count // workers)
+        for _ in range(workers - 1):
+            # Last row in this range; OFFSET walks the primary key index
+            sqlite_cursor.execute(
+                'SELECT id, vin_value FROM vin_records WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?',
+                (start, per_range - 1)
+            )
+            row = sqlite_cursor.fetchone()
+            if not row or row[0] >= max_id:
+                break
+            ranges.append({'after_id': start, 'end_id': row[0], 'end_vin': row[1],
+                           'last_id': start, 'last_vin': start_vin, 'migrated': 0})
+            start, start_vin = row
+        ranges.append({'after_id': start, 'end_id': max_id, 'end_vin': row_vin(sqlite_conn, max_id),
+                       'last_id': start, 'last_vin': start_vin, 'migrated': 0})
+        return ranges
+    finally:
+        sqlite_conn.close()
+
+def migrate_parallel(sqlite_path, collection, checkpoint, checkpoint_path, batch_size, workers, limiter):
+    """Migrate id ranges concurrently, checkpointing each range separately
+
+    checkpoint['ranges'] survives an interrupted run, so the next run resumes
+    every range from its own last_id (migrate_to_mongodb has already checked
+    they still point at the same rows). Once all ranges are done the
+    checkpoint collapses back to a single last_id for later incremental runs.
+    """
+    ranges = checkpoint.get('ranges')
+    if ranges:
+        # Rows added since the interrupted run get ranges of their own
+        tail = plan_ranges(sqlite_path, max(r['end_id'] for r in ranges), workers)
+        ranges = ranges + tail
+    else:
+        ranges = plan_ranges(sqlite_path, checkpoint['last_id'], workers)
+    checkpoint['ranges'] = ranges
+    write_checkpoint(checkpoint_path, checkpoint)
+    # Ranges finished by an earlier run stay in the checkpoint until all are done
+    pending = [r for r in ranges if r['last_id'] < r['end_id']]
+
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    try:
+        progress = Progress(sum(
+            sqlite_conn.execute('SELECT COUNT(*) FROM vin_records WHERE id > ? AND id <= ?',
+                                (r['last_id'], r['end_id'])).fetchone()[0]
+            for r in pending
+        ))
+    finally:
+        sqlite_conn.close()
+    logger.info(f"{progress.total} records to migrate in {len(pending)} ranges with {workers} workers")
+
+    lock = threading.Lock()
+
+    def run(id_range):
+        def on_batch(rows, written, failed_ids):
+            with lock:
+                advance(id_range, rows, failed_ids)
+                id_range['migrated'] += written
+                checkpoint['migrated'] += written
+                checkpoint['updated_at'] = datetime.utcnow().isoformat()
+                write_checkpoint(checkpoint_path, checkpoint)
+            progress.update(written, len(failed_ids))
+
+        migrate_range(sqlite_path, collection, id_range['last_id'], id_range['end_id'],
+                      batch_size, limiter, on_batch)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, id_range) for id_range in pending]
+        errors_seen = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors_seen.append(e)
+                logger.error(f"Migration worker failed: {str(e)}")
+    if errors_seen:
+        raise RuntimeError(f"{len(errors_seen)} of {len(pending)} ranges did not finish")
+
+    unfinished = [r for r in ranges if r['last_id'] < r['end_id']]
+    if unfinished:
+        # A range held below a failed row is retried by the next run
+        logger.warning(f"{len(unfinished)} ranges stopped at failed records; "
+                       "the checkpoint keeps them for the next run")
+        return progress
+
+    # Every range is complete: a plain last_id is enough from here on
+    if ranges:
+        last = max(ranges, key=lambda r: r['end_id'])
+        if last['end_id'] > checkpoint['last_id']:
+            checkpoint['last_id'], checkpoint['last_vin'] = last['end_id'], last['end_vin']
+    checkpoint.pop('ranges', None)
+    write_checkpoint(checkpoint_path, checkpoint)
+    return progress
+
+def migrate_to_mongodb(sqlite_path='vin_database.db', batch_size=1000,
+                       checkpoint_path=DEFAULT_CHECKPOINT, restart=False,
+                       workers=1, max_rate=0):
+    """Migrate VIN records from SQLite to MongoDB Atlas
+
+    Rows are streamed from SQLite in id order and written with unordered
+    bulk_write batches. After each batch the last migrated id is saved to
+    checkpoint_path, so an interrupted run resumes where it stopped and a
+    later run only sends rows added since. With workers > 1 the ids are split
+    into ranges that are migrated concurrently; max_rate caps the combined
+    records per second either way.
+    """
     try:
         # Connect to MongoDB Atlas with secure settings
         client = MongoClient(
@@ -32,36 +338,63 @@ def migrate_to_mongodb():
             tlsAllowInvalidCertificates=False,
             tlsCAFile=certifi.where()
         )
+        if workers > 50:
+            logger.warning(f"{workers} workers is more than the 50 pooled connections; some will wait for one")
         db = client.vin_database
         vin_collection = db.vin_records
-        
-        # Connect to SQLite
-        sqlite_conn = sqlite3.connect('vin_database.db')
-        sqlite_cursor = sqlite_conn.cursor()
-        
-        # Get all records from SQLite
-        sqlite_cursor.execute('SELECT * FROM vin_records')
-        records = sqlite_cursor.fetchall()
-        
-        # Migrate each record
-        for record in records:
-            vin_doc = {
-                'vin_value': record[1],
-                'description': record[2],
-                'scan_date': record[3],
-                'migrated_at': datetime.utcnow()
-            }
-            vin_collection.update_one(
-                {'vin_value': record[1]},
-                {'$set': vin_doc},
-                upsert=True
-            )
-            print(f"Migrated VIN: {record[1]}")
-            
-        print(f"\nSuccessfully migrated {len(records)} records to MongoDB")
-        
+
+        # Index vin_value before upserting so each upsert filter is an index lookup
+        ensure_indexes(db)
+
+        sqlite_conn = sqlite3.connect(sqlite_path)
+        source = source_fingerprint(sqlite_conn, sqlite_path)
+        checkpoint = empty_checkpoint(source) if restart else read_checkpoint(checkpoint_path, source)
+        if not checkpoint_matches(sqlite_conn, checkpoint, source):
+            logger.warning(f"{checkpoint_path} was taken from a different or rebuilt vin_records table; "
+                           "starting over from the first row")
+            checkpoint = empty_checkpoint(source)
+        checkpoint['source'] = source
+        sqlite_conn.close()
+        # Rows that failed last time are retried from where the checkpoint stopped
+        for position in [checkpoint] + checkpoint.get('ranges', []):
+            position.pop('failed_id', None)
+        if checkpoint['last_id'] or checkpoint.get('ranges'):
+            logger.info(f"Resuming after id {checkpoint['last_id']} "
+                        f"({checkpoint['migrated']} records migrated previously)")
+        limiter = RateLimiter(max_rate)
+
+        if workers > 1 or checkpoint.get('ranges'):
+            # An interrupted parallel run is always finished range by range
+            progress = migrate_parallel(sqlite_path, vin_collection, checkpoint, checkpoint_path,
+                                        batch_size, max(workers, 1), limiter)
+        else:
+            # Connect to SQLite
+            sqlite_conn = sqlite3.connect(sqlite_path)
+            sqlite_cursor = sqlite_conn.cursor()
+            sqlite_cursor.execute('SELECT COUNT(*) FROM vin_records WHERE id > ?', (checkpoint['last_id'],))
+            progress = Progress(sqlite_cursor.fetchone()[0])
+            logger.info(f"{progress.total} records to migrate")
+
+            def on_batch(rows, written, failed_ids):
+                advance(checkpoint, rows, failed_ids)
+                checkpoint['migrated'] += written
+                checkpoint['updated_at'] = datetime.utcnow().isoformat()
+                write_checkpoint(checkpoint_path, checkpoint)
+                progress.update(written, len(failed_ids))
+
+            # Stream rows in id order instead of loading the whole table
+            migrate_range(sqlite_path, vin_collection, checkpoint['last_id'], None,
+                          batch_size, limiter, on_batch)
+
+        progress.update(0, 0, force=True)
+        print(f"\nSuccessfully migrated {progress.done - progress.failed} records to MongoDB "
+              f"({progress.failed} failed)")
+        if progress.failed:
+            print("The checkpoint stops below the first failed record; re-run to retry it")
+
     except Exception as e:
         print(f"Error during migration: {str(e)}")
+        print(f"Re-run to resume from the checkpoint in {checkpoint_path}")
     finally:
         if 'sqlite_conn' in locals():
             sqlite_conn.close()
@@ -69,4 +402,13 @@ def migrate_to_mongodb():
             client.close()
 
 if __name__ == "__main__":
-    migrate_to_mongodb() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Migrate vin_records from SQLite to MongoDB Atlas')
+    parser.add_argument('--sqlite-path', default='vin_database.db')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='file recording the last migrated id')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and migrate every row')
+    parser.add_argument('--workers', type=int, default=1, help='migrate this many id ranges concurrently')
+    parser.add_argument('--max-rate', type=int, default=0, help='overall records/s limit (0 = unlimited)')
+    args = parser.parse_args()
+    migrate_to_mongodb(args.sqlite_path, args.batch_size, args.checkpoint, args.restart,
+                       args.workers, args.max_rate)
@@ -0,0 +1,143 @@
+from pymongo import monitoring
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class DatabaseUnavailable(Exception):
+    """Raised instead of touching MongoDB while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Fail fast while MongoDB is down, letting one probe through to recover
+
+    closed    -> requests flow; consecutive failures open the breaker
+    open      -> requests are rejected until reset_timeout has passed
+    half_open -> a single probe request is let through; success closes the
+                 breaker, failure opens it again
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a request may go to MongoDB"""
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                logger.info("Circuit breaker half-open, probing MongoDB")
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        if self.state == self.CLOSED and self.failures == 0:
+            return
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Circuit breaker closed, MongoDB is reachable again")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error) if error else None
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._open()
+
+    def trip(self, error=None):
+        """Open the breaker immediately (used by the heartbeat monitor)"""
+        with self._lock:
+            self.last_error = str(error) if error else None
+            if self.state != self.OPEN:
+                self._open()
+
+    def allow_probe(self):
+        """Let the next request probe MongoDB without waiting out reset_timeout"""
+        with self._lock:
+            if self.state == self.OPEN:
+                self.state = self.HALF_OPEN
+                logger.info("MongoDB heartbeat succeeded, circuit breaker half-open")
+
+    def _open(self):
+        if self.state != self.OPEN:
+            logger.warning(f"Circuit breaker opened: {self.last_error}")
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def status(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'open_for_seconds': round(time.monotonic() - self.opened_at, 1) if self.opened_at else None,
+            'last_error': self.last_error
+        }
+
+class MongoHealthMonitor(monitoring.ServerHeartbeatListener):
+    """Track MongoDB health from the driver's own background heartbeats
+
+    pymongo already pings every server from its monitor threads, so listening
+    to those events gives a shared health state without any extra round
+    trips on the request path.
+    """
+
+    def __init__(self, breaker):
+        self.breaker = breaker
+        self._servers = {}
+
+    @property
+    def healthy(self):
+        servers = list(self._servers.values())
+        return bool(servers) and any(server['ok'] for server in servers)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._servers[event.connection_id] = {
+            'ok': True,
+            'last_heartbeat': time.time(),
+            'duration_ms': round(event.duration * 1000, 1),
+            'error': None
+        }
+        self.breaker.allow_probe()
+
+    def failed(self, event):
+        previous = self._servers.get(event.connection_id)
+        self._servers[event.connection_id] = {
+            'ok': False,
+            'last_heartbeat': time.time(),
+            'duration_ms': round(event.duration * 1000, 1),
+            'error': str(event.reply)
+        }
+        if previous is None or previous['ok']:
+            # Log transitions only; the driver retries failed servers every 500ms
+            logger.warning(f"MongoDB heartbeat to {event.connection_id} failed: {event.reply}")
+        if not self.healthy:
+            self.breaker.trip(event.reply)
+
+    def status(self):
+        return {
+            'healthy': self.healthy,
+            'servers': {
+                f"{host}:{port}": server for (host, port), server in list(self._servers.items())
+            }
+        }
@@ -0,0 +1,181 @@
+from collections import deque
+import threading
+import time
+
+# Capture/decode pipeline behind VINScanner.scan_qr_code (t.py).
+#
+# A capture thread reads frames as fast as the source delivers them and
+# publishes each one as the newest frame for display. It also offers the
+# frame to a small pool of decode threads through a bounded queue that
+# drops the oldest frame when full, so a slow decoder skips frames instead
+# of building up lag. pyzbar and OpenCV release the GIL in native code, so
+# decode threads run alongside capture and display.
+
+class DropOldestQueue:
+    """Bounded FIFO whose put() never blocks: when full, the oldest item is dropped"""
+
+    def __init__(self, maxsize=2):
+        self._items = deque()
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Next item, or None once closed (or on timeout)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            return self._items.popleft() if self._items else None
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+class RateMeter:
+    """Events per second over a sliding window"""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.count = 0
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.count += 1
+            self._times.append(now)
+            while self._times and now - self._times[0] > self.window:
+                self._times.popleft()
+
+    def rate(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            while self._times and now - self._times[0] > self.window:
+                self._times.popleft()
+            if len(self._times) < 2:
+                return 0.0
+            return (len(self._times) - 1) / max(now - self._times[0], 1e-9)
+
+class ScanPipeline:
+    """Capture thread + decode pool around read_frame/decode_frame callables
+
+    read_frame() returns (ok, frame) like cv2.VideoCapture.read;
+    decode_frame(frame) returns the decoded objects (pyzbar results). For
+    frames with at least one decoded object, (seq, objects) goes on the hits
+    queue, which keeps only the newest hits_size entries.
+    """
+
+    def __init__(self, read_frame, decode_frame, decode_workers=2, queue_size=2, hits_size=4):
+        self.read_frame = read_frame
+        self.decode_frame = decode_frame
+        self.decode_workers = decode_workers
+        self.decode_queue = DropOldestQueue(queue_size)
+        self.hits = DropOldestQueue(hits_size)
+        self.capture_rate = RateMeter()
+        self.decode_rate = RateMeter()
+        self.decode_seconds = 0.0
+        self.failed = None
+        self.last_error = None
+        self._latest = None
+        self._frame_cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._capture, name='scan-capture', daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._decode, name=f'scan-decode-{i}', daemon=True)
+            for i in range(self.decode_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Stop and join all threads (call before releasing the capture device)"""
+        self._stop.set()
+        self.decode_queue.close()
+        self.hits.close()
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
+
+    def _capture(self):
+        seq = 0
+        while not self._stop.is_set():
+            ok, frame = self.read_frame()
+            if not ok:
+                self.failed = 'Failed to grab frame'
+                break
+            seq += 1
+            self.capture_rate.tick()
+            with self._frame_cond:
+                self._latest = (seq, frame)
+                self._frame_cond.notify_all()
+            self.decode_queue.put((seq, frame))
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+
+    def _decode(self):
+        while not self._stop.is_set():
+            item = self.decode_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            seq, frame = item
+            started = time.perf_counter()
+            try:
+                objects = self.decode_frame(frame)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                objects = []
+            elapsed = time.perf_counter() - started
+            self.decode_rate.tick()
+            with self._frame_cond:
+                self.decode_seconds += elapsed
+            if objects:
+                self.hits.put((seq, objects))
+
+    def wait_frame(self, after_seq=0, timeout=0.1):
+        """Newest (seq, frame) newer than after_seq, or None if none arrives in time"""
+        with self._frame_cond:
+            self._frame_cond.wait_for(
+                lambda: (self._latest and self._latest[0] > after_seq) or self.failed or self._stop.is_set(),
+                timeout
+            )
+            if self._latest and self._latest[0] > after_seq:
+                return self._latest
+            return None
+
+    def stats(self):
+        decoded = self.decode_rate.count
+        return {
+            'capture_fps': self.capture_rate.rate(),
+            'decode_fps': self.decode_rate.rate(),
+            'frames_captured': self.capture_rate.count,
+            'frames_decoded': decoded,
+            'frames_dropped': self.decode_queue.dropped,
+            'decode_ms': 1000.0 * self.decode_seconds / decoded if decoded else 0.0
+        }
+
+def format_stats(stats):
+    return (f"capture {stats['capture_fps']:.1f} fps | decode {stats['decode_fps']:.1f} fps "
+            f"({stats['decode_ms']:.0f} ms) | dropped {stats['frames_dropped']}")
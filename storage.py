@@ -0,0 +1,229 @@
+from datetime import datetime
+from pymongo import errors
+import logging
+import os
+import sqlite3
+import threading
+from db_schema import (
+    VIN_LOOKUP_PROJECTION, bulk_upsert_operations, lookup_filter, lookup_many_filter, upsert_update
+)
+
+logger = logging.getLogger(__name__)
+
+# Storage backends behind check_vin/add_vin. Records are dicts with
+# vin_value, description and scan_date; bulk_upsert returns a dict shaped
+# like pymongo's bulk_api_result (nUpserted, nModified, upserted, writeErrors)
+# so vin_payloads.bulk_batch_results works for every backend.
+
+class VINStore:
+    """Interface implemented by each storage backend"""
+
+    name = None
+
+    def find(self, vin):
+        """Return the record for a VIN, or None"""
+        raise NotImplementedError
+
+    def find_many(self, vins):
+        """Return the records that exist for a list of VINs"""
+        raise NotImplementedError
+
+    def upsert(self, vin, description, scan_date):
+        """Insert or update one VIN; returns {'modified_count', 'upserted_id'}"""
+        raise NotImplementedError
+
+    def bulk_upsert(self, records, scan_date):
+        """Insert or update many VINs in one round trip"""
+        raise NotImplementedError
+
+    def status(self):
+        return {'backend': self.name}
+
+    def after_fork(self):
+        """Drop state inherited from the parent process (called in each forked worker)"""
+
+class MongoVINStore(VINStore):
+    """vin_records in MongoDB, with each call run through the app's retry/circuit breaker"""
+
+    name = 'mongo'
+
+    def __init__(self, get_db, run=None):
+        self.get_db = get_db
+        self.run = run or (lambda func, max_retries=3: func())
+
+    def find(self, vin):
+        def query_vin():
+            return self.get_db().vin_records.find_one(
+                lookup_filter(vin),
+                VIN_LOOKUP_PROJECTION,
+                max_time_ms=5000
+            )
+        return self.run(query_vin)
+
+    def find_many(self, vins):
+        def query_vins():
+            return list(self.get_db().vin_records.find(
+                lookup_many_filter(vins),
+                VIN_LOOKUP_PROJECTION,
+                max_time_ms=5000
+            ))
+        return self.run(query_vins)
+
+    def upsert(self, vin, description, scan_date):
+        def upsert_vin():
+            return self.get_db().vin_records.update_one(
+                lookup_filter(vin),
+                upsert_update(vin, description, scan_date),
+                upsert=True
+            )
+
+        # The upsert is idempotent, so retrying it is safe
+        result = self.run(upsert_vin)
+        return {
+            'modified_count': result.modified_count,
+            'upserted_id': str(result.upserted_id) if result.upserted_id else None
+        }
+
+    def bulk_upsert(self, records, scan_date):
+        operations = bulk_upsert_operations(records, scan_date)
+
+        def write_batch():
+            return self.get_db().vin_records.bulk_write(operations, ordered=False)
+
+        try:
+            # Single attempt: the breaker still gates the batch and records its outcome
+            return self.run(write_batch, max_retries=1).bulk_api_result
+        except errors.BulkWriteError as e:
+            # Unordered writes carry on past failures; report them per item
+            logger.warning(f"Bulk write batch had {len(e.details.get('writeErrors', []))} errors")
+            return e.details
+
+class SQLiteVINStore(VINStore):
+    """vin_records in a local SQLite file (the schema init_database.py builds)
+
+    Each thread keeps its own connection in WAL mode with memory-mapped I/O,
+    so readers never block each other or the writer. The SQL strings are
+    constant, so sqlite3's per-connection statement cache reuses the
+    prepared statements instead of re-parsing them.
+    """
+
+    name = 'sqlite'
+
+    FIND_SQL = 'SELECT vin_value, description, scan_date FROM vin_records WHERE vin_value = ?'
+    UPSERT_SQL = '''
+        INSERT INTO vin_records (vin_value, description, scan_date) VALUES (?, ?, ?)
+        ON CONFLICT(vin_value) DO UPDATE SET
+            description = excluded.description,
+            scan_date = excluded.scan_date
+    '''
+    # IN lists are sent in fixed-size chunks so the statement cache stays small
+    IN_CHUNK = 100
+
+    def __init__(self, path, mmap_size=256 * 1024 * 1024, cache_kib=16384, busy_timeout_ms=5000):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.cache_kib = cache_kib
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS vin_records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                vin_value TEXT UNIQUE NOT NULL,
+                description TEXT,
+                scan_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+
+    def after_fork(self):
+        # SQLite connections must not be used across fork; each worker opens its own
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, cached_statements=256)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            conn.execute(f'PRAGMA cache_size=-{int(self.cache_kib)}')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _record(row):
+        vin_value, description, scan_date = row
+        if isinstance(scan_date, str):
+            # Stored as CURRENT_TIMESTAMP text; hand back a datetime like Mongo does
+            try:
+                scan_date = datetime.fromisoformat(scan_date)
+            except ValueError:
+                pass
+        return {'vin_value': vin_value, 'description': description, 'scan_date': scan_date}
+
+    @staticmethod
+    def _timestamp(scan_date):
+        # Same text format as SQLite's CURRENT_TIMESTAMP
+        return scan_date.strftime('%Y-%m-%d %H:%M:%S')
+
+    def _select_in(self, conn, columns, vins):
+        rows = []
+        vins = list(vins)
+        for start in range(0, len(vins), self.IN_CHUNK):
+            chunk = vins[start:start + self.IN_CHUNK]
+            padded = chunk + [None] * (self.IN_CHUNK - len(chunk))
+            rows.extend(conn.execute(
+                f"SELECT {columns} FROM vin_records WHERE vin_value IN ({','.join('?' * self.IN_CHUNK)})",
+                padded
+            ))
+        return rows
+
+    def find(self, vin):
+        row = self._connection().execute(self.FIND_SQL, (vin,)).fetchone()
+        return self._record(row) if row else None
+
+    def find_many(self, vins):
+        return [self._record(row) for row in self._select_in(self._connection(), 'vin_value, description, scan_date', vins)]
+
+    def upsert(self, vin, description, scan_date):
+        conn = self._connection()
+        with conn:
+            existed = conn.execute('SELECT 1 FROM vin_records WHERE vin_value = ?', (vin,)).fetchone()
+            cursor = conn.execute(self.UPSERT_SQL, (vin, description, self._timestamp(scan_date)))
+        if existed:
+            return {'modified_count': 1, 'upserted_id': None}
+        return {'modified_count': 0, 'upserted_id': str(cursor.lastrowid)}
+
+    def bulk_upsert(self, records, scan_date):
+        conn = self._connection()
+        timestamp = self._timestamp(scan_date)
+        vins = [record['vin_value'] for record in records]
+        with conn:
+            existing = {row[0] for row in self._select_in(conn, 'vin_value', vins)}
+            conn.executemany(self.UPSERT_SQL, [
+                (record['vin_value'], record['description'], timestamp) for record in records
+            ])
+            ids = {vin: row_id for row_id, vin in self._select_in(conn, 'id, vin_value', vins)}
+
+        upserted = [
+            {'index': index, '_id': ids.get(record['vin_value'])}
+            for index, record in enumerate(records) if record['vin_value'] not in existing
+        ]
+        return {
+            'nUpserted': len(upserted),
+            'nModified': len(records) - len(upserted),
+            'upserted': upserted,
+            'writeErrors': []
+        }
+
+    def status(self):
+        conn = self._connection()
+        return {
+            'backend': self.name,
+            'path': os.path.abspath(self.path),
+            'journal_mode': conn.execute('PRAGMA journal_mode').fetchone()[0],
+            'mmap_size': conn.execute('PRAGMA mmap_size').fetchone()[0]
+        }
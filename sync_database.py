@@ -0,0 +1,276 @@
+import sqlite3
+from pymongo import MongoClient, UpdateOne, errors
+from datetime import datetime, timedelta
+import os
+from dotenv import load_dotenv
+import argparse
+import certifi
+import json
+import logging
+from db_schema import ensure_indexes
+from migrate_to_cloud import row_vin, source_fingerprint, write_checkpoint
+
+load_dotenv()
+
+# MongoDB Atlas connection string from environment variables
+MONGO_URI = os.getenv('MONGO_URI')
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Incremental two-way sync between the local vin_database.db and MongoDB.
+#
+# Each run only reads records changed since the watermarks saved in the state
+# file. Conflicts are last write wins on scan_date: a record is only
+# overwritten by a copy with a strictly newer scan_date, so both sides end up
+# with the same copy whichever side syncs first. Equal scan_dates count as the
+# same write and are left alone.
+
+DEFAULT_STATE = 'sync_state.json'
+
+# Writes that committed with a slightly older timestamp than the last record
+# seen (clock skew between app instances) are picked up by re-reading this window
+DEFAULT_OVERLAP_SECONDS = 60
+
+# scan_date text written to SQLite; milliseconds match what MongoDB stores,
+# so a pulled record reads back equal and is not pushed again as newer
+SQLITE_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+PULL_SQL = '''
+    INSERT INTO vin_records (vin_value, description, scan_date) VALUES (?, ?, ?)
+    ON CONFLICT(vin_value) DO UPDATE SET
+        description = excluded.description,
+        scan_date = excluded.scan_date
+    WHERE vin_records.scan_date IS NULL OR excluded.scan_date > vin_records.scan_date
+'''
+
+def empty_state():
+    return {'pull_watermark': None, 'push_last_id': 0, 'push_last_vin': None, 'push_watermark': None}
+
+def read_state(path):
+    """Return the saved watermarks, or empty ones before the first sync"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return empty_state()
+
+def state_matches(sqlite_conn, state, source):
+    """True if the watermarks were saved against this vin_records table
+
+    init_database.py drops and recreates the table, which restarts the ids
+    push_last_id counts and loses everything pulled so far.
+    """
+    if state.get('synced_at') is None:
+        return True
+    if state.get('source') != source:
+        return False
+    return not state['push_last_id'] or row_vin(sqlite_conn, state['push_last_id']) == state.get('push_last_vin')
+
+def to_sqlite_timestamp(value):
+    # Whole seconds keep CURRENT_TIMESTAMP's format so equal times compare equal as text
+    if not value.microsecond:
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value.strftime(SQLITE_TIMESTAMP_FORMAT)[:-3]
+
+def from_sqlite_timestamp(value):
+    """Parse CURRENT_TIMESTAMP-style text; returns None if it can't be read"""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+def ensure_sqlite_indexes(sqlite_conn):
+    """Index scan_date so the push side only reads changed rows"""
+    sqlite_conn.execute('CREATE INDEX IF NOT EXISTS idx_vin_records_scan_date ON vin_records(scan_date)')
+    sqlite_conn.commit()
+
+def pull_changes(db, sqlite_conn, state, batch_size, overlap):
+    """Copy MongoDB records changed since the pull watermark into SQLite"""
+    query = {}
+    if state['pull_watermark']:
+        since = datetime.fromisoformat(state['pull_watermark']) - overlap
+        # add_vin sets scan_date; migrate_to_cloud.py sets migrated_at
+        query = {'$or': [{'scan_date': {'$gt': since}}, {'migrated_at': {'$gt': since}}]}
+
+    cursor = db.vin_records.find(
+        query,
+        {'_id': 0, 'vin_value': 1, 'description': 1, 'scan_date': 1, 'migrated_at': 1},
+        batch_size=batch_size
+    )
+    watermark = from_sqlite_timestamp(state['pull_watermark'])
+    seen = applied = 0
+    batch = []
+
+    def flush():
+        nonlocal applied
+        with sqlite_conn:
+            before = sqlite_conn.total_changes
+            sqlite_conn.executemany(PULL_SQL, batch)
+            applied += sqlite_conn.total_changes - before
+        batch.clear()
+
+    for document in cursor:
+        seen += 1
+        scan_date = document.get('scan_date')
+        for changed_at in (scan_date, document.get('migrated_at')):
+            if isinstance(changed_at, datetime) and (watermark is None or changed_at > watermark):
+                watermark = changed_at
+        if not isinstance(scan_date, datetime):
+            continue
+        batch.append((document['vin_value'], document.get('description'), to_sqlite_timestamp(scan_date)))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    if watermark:
+        state['pull_watermark'] = watermark.isoformat()
+    logger.info(f"Pulled {seen} changed records from MongoDB, {applied} applied locally")
+    return applied
+
+def push_batch(collection, rows):
+    """Upsert rows that are newer than MongoDB's copy; returns (applied, skipped, failed)"""
+    operations = []
+    for vin_value, description, scan_date in rows:
+        # Matches only when MongoDB's copy is older or has no date scan_date
+        # (missing, null, or the strings migrate_to_cloud.py wrote; MongoDB
+        # never compares a string with a date). For a newer or equal copy the
+        # upsert tries an insert instead, which the unique vin_value index
+        # rejects: that duplicate key error means "keep remote".
+        operations.append(UpdateOne(
+            {'vin_value': vin_value,
+             '$or': [{'scan_date': {'$lt': scan_date}}, {'scan_date': {'$not': {'$type': 'date'}}}]},
+            {'$set': {'vin_value': vin_value, 'description': description, 'scan_date': scan_date}},
+            upsert=True
+        ))
+    try:
+        collection.bulk_write(operations, ordered=False)
+        return len(rows), 0, 0
+    except errors.BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+        unexpected = [error for error in write_errors if error.get('code') != 11000]
+        for error in unexpected[:5]:
+            logger.error(f"Failed to push VIN {rows[error['index']][0]}: {error.get('errmsg')}")
+        return len(rows) - len(write_errors), len(write_errors) - len(unexpected), len(unexpected)
+
+def push_changes(db, sqlite_conn, state, batch_size, overlap):
+    """Send SQLite rows inserted or updated since the push watermarks to MongoDB"""
+    last_id = state['push_last_id']
+    last_vin = state.get('push_last_vin')
+    watermark = state['push_watermark']
+    since = None
+    if watermark:
+        since = to_sqlite_timestamp(datetime.fromisoformat(watermark) - overlap)
+
+    # New rows are found by id, updated rows by scan_date; both columns are indexed
+    sqlite_cursor = sqlite_conn.cursor()
+    if since:
+        sqlite_cursor.execute(
+            'SELECT id, vin_value, description, scan_date FROM vin_records WHERE id > ? OR scan_date > ?',
+            (last_id, since)
+        )
+    else:
+        sqlite_cursor.execute(
+            'SELECT id, vin_value, description, scan_date FROM vin_records WHERE id > ?',
+            (last_id,)
+        )
+
+    newest = from_sqlite_timestamp(watermark)
+    applied = skipped = failed = 0
+    try:
+        while True:
+            rows = sqlite_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batch = []
+            for row_id, vin_value, description, scan_date in rows:
+                if row_id > last_id:
+                    last_id, last_vin = row_id, vin_value
+                scan_date = from_sqlite_timestamp(scan_date)
+                if scan_date is None:
+                    logger.warning(f"Skipping VIN {vin_value}: unreadable scan_date")
+                    continue
+                newest = scan_date if newest is None else max(newest, scan_date)
+                batch.append((vin_value, description, scan_date))
+            if batch:
+                batch_applied, batch_skipped, batch_failed = push_batch(db.vin_records, batch)
+                applied += batch_applied
+                skipped += batch_skipped
+                failed += batch_failed
+    finally:
+        sqlite_cursor.close()
+
+    if failed:
+        # Leave the watermarks where they were, so the failed rows are retried
+        logger.error(f"{failed} local changes failed to push; push watermarks not advanced")
+    else:
+        state['push_last_id'], state['push_last_vin'] = last_id, last_vin
+        if newest:
+            state['push_watermark'] = newest.isoformat()
+    logger.info(f"Pushed {applied} local changes to MongoDB, {skipped} kept MongoDB's copy")
+    return applied
+
+def sync(sqlite_path='vin_database.db', state_path=DEFAULT_STATE, direction='both',
+         batch_size=1000, overlap_seconds=DEFAULT_OVERLAP_SECONDS, restart=False):
+    """Exchange records changed since the last sync between SQLite and MongoDB"""
+    try:
+        # Connect to MongoDB Atlas with secure settings
+        client = MongoClient(
+            MONGO_URI,
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=5000,
+            socketTimeoutMS=30000,
+            retryWrites=True,
+            w='majority',
+            tls=True,
+            tlsAllowInvalidCertificates=False,
+            tlsCAFile=certifi.where()
+        )
+        db = client.vin_database
+        ensure_indexes(db)
+
+        sqlite_conn = sqlite3.connect(sqlite_path)
+        ensure_sqlite_indexes(sqlite_conn)
+
+        state = empty_state() if restart else read_state(state_path)
+        if not state_matches(sqlite_conn, state, source_fingerprint(sqlite_conn, sqlite_path)):
+            logger.warning(f"{state_path} was saved against a different or rebuilt vin_records table; "
+                           "comparing every record")
+            state = empty_state()
+        overlap = timedelta(seconds=overlap_seconds)
+
+        # Pull first so records that are newer remotely are never pushed back
+        if direction in ('both', 'pull'):
+            pull_changes(db, sqlite_conn, state, batch_size, overlap)
+        if direction in ('both', 'push'):
+            push_changes(db, sqlite_conn, state, batch_size, overlap)
+
+        # Taken after the pull, which may have given an empty table its first row
+        state['source'] = source_fingerprint(sqlite_conn, sqlite_path)
+        state['synced_at'] = datetime.utcnow().isoformat()
+        write_checkpoint(state_path, state)
+        print(f"\nSync complete, watermarks saved to {state_path}")
+
+    except Exception as e:
+        print(f"Error during sync: {str(e)}")
+        print("Watermarks were not advanced; the next run repeats this sync")
+    finally:
+        if 'sqlite_conn' in locals():
+            sqlite_conn.close()
+        if 'client' in locals():
+            client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Incrementally sync vin_records between SQLite and MongoDB')
+    parser.add_argument('--sqlite-path', default='vin_database.db')
+    parser.add_argument('--state', default=DEFAULT_STATE, help='file recording the sync watermarks')
+    parser.add_argument('--direction', choices=('both', 'pull', 'push'), default='both')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--overlap-seconds', type=int, default=DEFAULT_OVERLAP_SECONDS,
+                        help='re-read this much before each watermark to tolerate clock skew')
+    parser.add_argument('--restart', action='store_true', help='ignore the watermarks and compare every record')
+    args = parser.parse_args()
+    sync(args.sqlite_path, args.state, args.direction, args.batch_size, args.overlap_seconds, args.restart)
@@ -1,31 +1,68 @@
+import argparse
 import cv2
-from pyzbar.pyzbar import decode
+import os
 import sqlite3
-from datetime import datetime
+import sys
+import time
 import numpy as np
-import tkinter as tk
-from tkinter import ttk
+from vin_validation import validate_vin
+from vin_lookup import LocalVINLookup
+from concurrent.futures import ThreadPoolExecutor
+from scan_pipeline import ScanPipeline, format_stats
+from decode_strategy import STRATEGIES, FrameDecoder, format_decoder_stats
+from frame_sources import open_source
+from batch_scan import batch_scan, format_batch_stats
+
+# Seconds between capture/decode rate lines printed while scanning
+STATS_REPORT_INTERVAL = 5.0
+
+# Scan states
+SCANNING = 'scanning'
+CHECKING = 'checking'
+SHOWING_RESULT = 'showing_result'
+
+# How long a lookup result stays on the preview (scanning continues meanwhile)
+RESULT_DISPLAY_SECONDS = 2.0
 
 class VINScanner:
-    def __init__(self, db_path='vin_database.db'):
+    def __init__(self, db_path='vin_database.db', snapshot_path=None, decode_workers=2,
+                 decode_strategy='adaptive', source='0', check_digit=True):
         self.db_path = db_path
-        self.setup_database()
+        self.source = source
+        # False for databases built with init_database.py --no-check-digit
+        self.check_digit = check_digit
+        self.decode_workers = decode_workers
+        self.decoder = FrameDecoder(decode_strategy)
+        if snapshot_path is None:
+            self.setup_database()
+        # One persistent read-only handle (SQLite, or a vin_snapshot.py snapshot
+        # for offline use), only ever used from the single lookup thread
+        self.lookup = LocalVINLookup(db_path, snapshot_path)
+        self.lookup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vin-lookup')
+        self.pending_check = None
         self.status_message = ""
         self.status_color = (0, 255, 0)
         self.last_scan_time = 0
         self.scan_cooldown = 2.0
         self.scanning_active = True
         self.cap = None
+        self.state = SCANNING
+        self.last_vin = None
+        self.current_vin = None
+        self.detected_at = 0
+        self.result = None
+        self.result_until = 0
         
     def setup_database(self):
-        """Initialize the SQLite database with a VIN records table"""
+        """Initialize the SQLite database with a VIN records table (the schema init_database.py builds)"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS vin_records (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vin_number TEXT UNIQUE NOT NULL,
+                vin_value TEXT UNIQUE NOT NULL,
+                description TEXT,
                 scan_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
@@ -33,155 +70,158 @@ class VINScanner:
         conn.commit()
         conn.close()
 
-    def show_status_window(self, vin_number, success, message):
-        """Show status window with scan results"""
-        # Create status window
-        status_window = tk.Tk()
-        status_window.title("Scan Results")
-        status_window.geometry("400x300")
-        
-        # Style configuration
-        style = ttk.Style()
-        style.configure("Success.TLabel", foreground="green", font=("Helvetica", 12))
-        style.configure("Error.TLabel", foreground="red", font=("Helvetica", 12))
-        style.configure("Header.TLabel", font=("Helvetica", 14, "bold"))
-        style.configure("Warning.TLabel", foreground="red", font=("Helvetica", 14, "bold"))
-        
-        # Create and pack widgets
-        header = ttk.Label(
-            status_window, 
-            text="VIN Scan Results", 
-            style="Header.TLabel"
-        )
-        header.pack(pady=20)
-        
-        # VIN label - red if not in database
-        vin_style = "Warning.TLabel" if not success else "Header.TLabel"
-        vin_label = ttk.Label(
-            status_window,
-            text=f"VIN: {vin_number}",
-            style=vin_style
-        )
-        vin_label.pack(pady=10)
-        
-        # Status message - always red if not successful
-        status_label = ttk.Label(
-            status_window,
-            text=message,
-            style="Error.TLabel" if not success else "Success.TLabel"
-        )
-        status_label.pack(pady=10)
-        
-        # Add database info if successful, otherwise show warning
-        if success:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            db_info = ttk.Label(
-                status_window,
-                text=f"Added to database at:\n{timestamp}",
-                style="Success.TLabel"
-            )
-            db_info.pack(pady=10)
+    def is_repeat(self, vin_number, now):
+        """True if vin_number was handled within the cooldown; each sighting restarts it
+
+        A code held in front of the camera is therefore checked once, and
+        again only after it has been out of view for scan_cooldown seconds.
+        """
+        repeat = vin_number == self.last_vin and now - self.last_scan_time < self.scan_cooldown
+        if vin_number == self.last_vin:
+            self.last_scan_time = now
+        return repeat
+
+    def handle_decoded(self, decoded_objects, now):
+        """Start checking the first new VIN among decoded_objects; returns True if one was found"""
+        for obj in decoded_objects:
+            try:
+                vin_number = obj.data.decode('utf-8')
+            except UnicodeDecodeError as e:
+                print(f"Error processing VIN: {str(e)}")  # Debug print
+                continue
+            if self.is_repeat(vin_number, now):
+                continue
+            print(f"\nScanned VIN: {vin_number}")  # Debug print
+            self.last_vin = vin_number
+            self.last_scan_time = now
+            self.current_vin = vin_number
+            self.detected_at = now
+            self.state = CHECKING
+            return True
+        return False
+
+    def update_state(self, now):
+        """Advance the state machine: start or collect a lookup, expire a shown result
+
+        The lookup runs on lookup_executor, so the preview keeps rendering
+        while it is in flight.
+        """
+        if self.state == CHECKING:
+            if self.pending_check is None:
+                print("Checking database...")  # Debug print
+                self.pending_check = self.lookup_executor.submit(self.process_vin, self.current_vin)
+                return
+            if not self.pending_check.done():
+                return
+            success, message = self.pending_check.result()
+            self.pending_check = None
+            print(f"Database check result: {message} ({1000 * (time.monotonic() - self.detected_at):.0f} ms)")
+            self.result = (success, message)
+            # Sightings aren't read during the lookup; restart the cooldown so
+            # a slow lookup doesn't let the same code be checked again at once
+            self.last_scan_time = now
+            self.state = SHOWING_RESULT
+            self.result_until = time.monotonic() + RESULT_DISPLAY_SECONDS
+        elif self.state == SHOWING_RESULT and now >= self.result_until:
+            self.state = SCANNING
+
+    def draw_state(self, frame):
+        """Overlay for the current state"""
+        if self.state == CHECKING:
+            self.draw_status_overlay(frame, f"CHECKING DATABASE\nVIN: {self.current_vin}", (0, 255, 255))
+        elif self.state == SHOWING_RESULT:
+            success, message = self.result
+            result_color = (0, 255, 0) if success else (0, 0, 255)
+            self.draw_status_overlay(frame, f"RESULT: {message}\nVIN: {self.current_vin}", result_color)
         else:
-            warning_label = ttk.Label(
-                status_window,
-                text="VIN NOT FOUND IN DATABASE",
-                style="Warning.TLabel"
-            )
-            warning_label.pack(pady=10)
-        
-        # Continue button
-        continue_btn = ttk.Button(
-            status_window,
-            text="Scan Next VIN",
-            command=lambda: self.resume_scanning(status_window)
-        )
-        continue_btn.pack(pady=20)
-        
-        # Center the window on screen
-        status_window.update_idletasks()
-        width = status_window.winfo_width()
-        height = status_window.winfo_height()
-        x = (status_window.winfo_screenwidth() // 2) - (width // 2)
-        y = (status_window.winfo_screenheight() // 2) - (height // 2)
-        status_window.geometry(f'{width}x{height}+{x}+{y}')
-        
-        status_window.mainloop()
-    
-    def resume_scanning(self, status_window):
-        """Resume scanning after status window is closed"""
-        status_window.destroy()
-        self.scanning_active = True
-        self.scan_qr_code()
+            self.draw_status_overlay(frame, "Ready to scan VIN QR Code...")
 
     def scan_qr_code(self):
-        """Scan QR code using MacBook camera"""
-        self.cap = cv2.VideoCapture(0)
+        """Scan QR code using MacBook camera (or any frame_sources.py source)
+
+        Capture and decoding run on their own threads (scan_pipeline.py);
+        this loop only renders the newest frame and drives the scan state
+        machine (scanning -> checking -> showing result -> scanning). The
+        camera stays open throughout, and a result stays on screen for
+        RESULT_DISPLAY_SECONDS while the next code can already be scanned.
+        """
+        # Files play back at their own pace, so the preview is watchable
+        self.cap = open_source(self.source, realtime=True)
         window_name = 'VIN QR Code Scanner (Press Q to quit)'
         cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-        
-        while self.scanning_active:
-            ret, frame = self.cap.read()
-            if not ret:
-                print("Failed to grab frame")
-                break
 
-            display_frame = frame.copy()
-            
-            try:
-                decoded_objects = decode(frame)
-                
-                for obj in decoded_objects:
-                    try:
-                        vin_number = obj.data.decode('utf-8')
-                        print(f"\nScanned VIN: {vin_number}")  # Debug print
-                        
-                        # Force display update for checking message
-                        check_frame = frame.copy()
-                        self.draw_status_overlay(
-                            check_frame,
-                            f"CHECKING DATABASE\nVIN: {vin_number}",
-                            (0, 255, 255)
-                        )
-                        cv2.imshow(window_name, check_frame)
-                        cv2.waitKey(1000)  # Wait 1 second
-                        
-                        print("Checking database...")  # Debug print
-                        success, message = self.process_vin(vin_number)
-                        print(f"Database check result: {message}")  # Debug print
-                        
-                        # Show result
-                        result_color = (0, 255, 0) if success else (0, 0, 255)
-                        result_frame = frame.copy()
-                        self.draw_status_overlay(
-                            result_frame,
-                            f"RESULT: {message}\nVIN: {vin_number}",
-                            result_color
-                        )
-                        cv2.imshow(window_name, result_frame)
-                        cv2.waitKey(2000)  # Wait 2 seconds
-                        
-                        # Close camera and show status window
-                        self.scanning_active = False
-                        self.cap.release()
-                        cv2.destroyAllWindows()
-                        self.show_status_window(vin_number, success, message)
-                        return
-                        
-                    except Exception as e:
-                        print(f"Error processing VIN: {str(e)}")  # Debug print
-                        continue
-                
-                # Show ready message
-                self.draw_status_overlay(display_frame, "Ready to scan VIN QR Code...")
-                
-            except Exception as e:
-                print(f"Scanning error: {str(e)}")  # Debug print
-                if "Assertion" not in str(e):
-                    self.draw_status_overlay(display_frame, f"Error: {str(e)}", (0, 0, 255))
+        pipeline = ScanPipeline(self.cap.read, self.decoder, self.decode_workers).start()
+        self.state = SCANNING
+        shown_seq = 0
+        last_report = time.monotonic()
+        try:
+            while self.scanning_active:
+                if pipeline.failed:
+                    print(pipeline.failed)
+                    break
+
+                latest = pipeline.wait_frame(shown_seq)
+                if latest is None:
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                    continue
+                shown_seq, frame = latest
+
+                now = time.monotonic()
+                if self.state != CHECKING:
+                    while True:
+                        hit = pipeline.hits.get(timeout=0)
+                        if hit is None:
+                            break
+                        _, decoded_objects = hit
+                        if self.handle_decoded(decoded_objects, now):
+                            # Older queued hits predate this VIN; don't replay them after the lookup
+                            pipeline.hits.clear()
+                            break
+
+                display_frame = frame.copy()
+                if pipeline.last_error and "Assertion" not in pipeline.last_error:
+                    print(f"Scanning error: {pipeline.last_error}")  # Debug print
+                    self.draw_status_overlay(display_frame, f"Error: {pipeline.last_error}", (0, 0, 255))
+                else:
+                    self.draw_state(display_frame)
+                stats = pipeline.stats()
+                self.draw_stats_footer(display_frame, format_stats(stats))
+
+                if now - last_report >= STATS_REPORT_INTERVAL:
+                    last_report = now
+                    print(format_stats(stats))
+                    print(format_decoder_stats(self.decoder.strategy, self.decoder.stats()))
 
-            cv2.imshow(window_name, display_frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+                cv2.imshow(window_name, display_frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+
+                # After the frame is on screen, so "CHECKING" shows while the lookup runs
+                was_checking = self.state == CHECKING
+                self.update_state(time.monotonic())
+                if was_checking and self.state != CHECKING:
+                    # Sightings queued during the lookup are stale; scan fresh frames
+                    pipeline.hits.clear()
+        finally:
+            pipeline.stop()
+            if self.pending_check is not None:
+                self.pending_check.cancel()
+                self.pending_check = None
+                self.state = SCANNING
+            self.cap.release()
+            cv2.destroyAllWindows()
+            stats = pipeline.stats()
+            if stats['frames_captured']:
+                print(f"Scan session: {stats['frames_captured']} frames captured, "
+                      f"{stats['frames_decoded']} decoded, {stats['frames_dropped']} skipped by the decoder")
+                print(format_decoder_stats(self.decoder.strategy, self.decoder.stats()))
+
+    def draw_stats_footer(self, frame, text):
+        """Draw capture/decode rates along the bottom edge"""
+        y_position = frame.shape[0] - 15
+        cv2.putText(frame, text, (10, y_position), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 4)
+        cv2.putText(frame, text, (10, y_position), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
 
     def draw_status_overlay(self, frame, message, text_color=None):
         """Draw status overlay on frame"""
@@ -207,42 +247,74 @@ class VINScanner:
                         font, font_scale, text_color if text_color else (255, 255, 255), thickness)
 
     def process_vin(self, vin_number):
-        """Process scanned VIN number"""
+        """Process scanned VIN number (runs on lookup_executor)"""
         print(f"\nProcessing VIN: {vin_number}")  # Debug print
         
-        if not self.is_valid_vin(vin_number):
-            print("Invalid VIN format")  # Debug print
-            return False, "Invalid VIN format"
-            
-        # Check if VIN exists in database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        vin_number, reason = validate_vin(vin_number, self.check_digit)
+        if reason:
+            print(f"Invalid VIN: {reason}")  # Debug print
+            return False, f"Invalid VIN ({reason.replace('_', ' ')})"
+
         try:
             print(f"Checking database for VIN: {vin_number}")  # Debug print
-            cursor.execute('SELECT COUNT(*) FROM vin_records WHERE vin_number = ?', (vin_number,))
-            count = cursor.fetchone()[0]
-            print(f"Found {count} matches in database")  # Debug print
-            
-            if count == 0:
-                return False, "VIN not found in database"
-            else:
+            if self.lookup.exists(vin_number):
                 return True, "VIN found in database"
+            else:
+                return False, "VIN not found in database"
                 
         except Exception as e:
             print(f"Database error: {str(e)}")  # Debug print
             return False, f"Error checking VIN: {str(e)}"
-        finally:
-            conn.close()
 
     def is_valid_vin(self, vin):
-        """Basic VIN validation (17 characters, alphanumeric)"""
-        if len(vin) != 17:
-            return False
-        return vin.isalnum()
+        """ISO 3779 VIN validation: character set, model year code and check digit"""
+        return validate_vin(vin, self.check_digit)[1] is None
 
 def main():
-    scanner = VINScanner()
+    parser = argparse.ArgumentParser(description='Scan VIN QR codes and check them against the local database')
+    parser.add_argument('--db', default='vin_database.db', help='SQLite database to check against')
+    parser.add_argument('--snapshot', default=os.getenv('VIN_SNAPSHOT'),
+                        help='VIN snapshot file to check against instead (no database needed)')
+    parser.add_argument('--source', action='append',
+                        help='camera index, video file, image directory or glob (default: camera 0); '
+                             'repeat with --headless to scan several')
+    parser.add_argument('--decode-workers', type=int, default=2, help='threads decoding frames in parallel')
+    parser.add_argument('--decode-strategy', choices=STRATEGIES, default='adaptive',
+                        help='full: colour frames as-is; gray: full-size grayscale; '
+                             'adaptive: downscaled search, ROI tracking and periodic full scans')
+    parser.add_argument('--no-check-digit', action='store_true',
+                        help='accept VINs whose position 9 is not an ISO 3779 check digit '
+                             '(databases built with init_database.py --no-check-digit)')
+    parser.add_argument('--headless', action='store_true',
+                        help='no window: decode video/image sources across a process pool and print NDJSON')
+    parser.add_argument('--workers', type=int, help='--headless decode processes (default: CPU count)')
+    parser.add_argument('--stride', type=int, default=1, help='--headless: decode every Nth video frame')
+    parser.add_argument('--dedupe-window', type=float,
+                        help='--headless: report a VIN again after this many seconds unseen '
+                             '(default: once per source)')
+    parser.add_argument('--output', help='--headless: NDJSON file to write (default: stdout)')
+    args = parser.parse_args()
+    sources = args.source or ['0']
+
+    if args.headless:
+        if args.stride < 1:
+            parser.error('--stride must be at least 1')
+        output = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            stats = batch_scan(sources, args.db, args.snapshot, args.workers, args.decode_strategy,
+                               args.stride, args.dedupe_window, output, not args.no_check_digit)
+        except ValueError as e:
+            parser.error(str(e))
+        finally:
+            if args.output:
+                output.close()
+        print(format_batch_stats(stats, args.stride), file=sys.stderr)
+        return
+
+    if len(sources) > 1:
+        parser.error('the interactive scanner takes a single --source')
+    scanner = VINScanner(args.db, args.snapshot, args.decode_workers, args.decode_strategy, sources[0],
+                         not args.no_check_digit)
     scanner.scan_qr_code()
 
 if __name__ == "__main__":
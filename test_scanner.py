@@ -1,13 +1,25 @@
 import cv2
-from pyzbar.pyzbar import decode
 import numpy as np
 import sqlite3
 from datetime import datetime
 import os
 import requests
+from vin_snapshot import VINSnapshot
+from decode_strategy import FrameDecoder, format_decoder_stats
+
+# With VIN_SNAPSHOT set, lookups use that offline snapshot instead of the API
+snapshot = VINSnapshot(os.environ['VIN_SNAPSHOT']) if os.getenv('VIN_SNAPSHOT') else None
+
+# DECODE_STRATEGY=full|gray|adaptive (see decode_strategy.py)
+frame_decoder = FrameDecoder(os.getenv('DECODE_STRATEGY', 'adaptive'))
 
 def check_database_for_vin(vin_number):
     """Check if scanned value exists in cloud database"""
+    if snapshot is not None:
+        found, description = snapshot.lookup(vin_number)
+        if found:
+            return True, f"Found match: {description or vin_number}"
+        return False, "Value not found in database"
     try:
         headers = {
             'X-API-Key': os.getenv('API_KEY')
@@ -68,7 +80,7 @@ def test_qr_detection():
             continue
             
         display_frame = frame.copy()
-        decoded_objects = decode(frame)
+        decoded_objects = frame_decoder(frame)
         
         if decoded_objects:
             for obj in decoded_objects:
@@ -111,6 +123,7 @@ def test_qr_detection():
     
     cap.release()
     cv2.destroyAllWindows()
+    print(format_decoder_stats(frame_decoder.strategy, frame_decoder.stats()))
 
 def main():
     print("=== VIN Scanner Test Suite ===")
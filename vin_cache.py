@@ -0,0 +1,126 @@
+from collections import OrderedDict
+import threading
+import time
+
+class VINCache:
+    """Bounded LRU cache of VIN lookups with separate TTLs for hits and misses
+
+    Each worker process keeps its own cache, so writes only invalidate the
+    entry in the process that handled them; the TTLs bound staleness elsewhere.
+
+    Within a process, a lookup that raced a write must not cache what it read
+    before the write: lookups take version() before reading the database and
+    pass it to set() as since, and the set is skipped if the VIN was written
+    after that.
+    """
+
+    def __init__(self, max_size=10000, ttl=300.0, miss_ttl=30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._entries = OrderedDict()
+        # vin -> version of its last write, for the most recently written VINs;
+        # older ones only leave their version in _written_floor
+        self._written = OrderedDict()
+        self._written_floor = 0
+        self._version = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_sets = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def get(self, vin):
+        """Return the cached lookup result for a VIN, or None if absent/expired"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(vin)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, result = entry
+            if expires_at <= time.monotonic():
+                del self._entries[vin]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(vin)
+            self.hits += 1
+            if not result.get('found'):
+                self.negative_hits += 1
+            return result
+
+    def version(self):
+        """Current write version; take it before a lookup reads the database"""
+        with self._lock:
+            return self._version
+
+    def _record_write(self, vin):
+        self._version += 1
+        self._written[vin] = self._version
+        self._written.move_to_end(vin)
+        while len(self._written) > self.max_size:
+            _, self._written_floor = self._written.popitem(last=False)
+
+    def set(self, vin, result, since=None):
+        """Cache a result; "not found" answers use the shorter miss TTL
+
+        Writes call this without since. A lookup passes the version() it took
+        before reading, and its result is dropped if the VIN has been written
+        since then.
+        """
+        if not self.enabled:
+            return
+        ttl = self.ttl if result.get('found') else self.miss_ttl
+        with self._lock:
+            if since is None:
+                self._record_write(vin)
+            elif self._written.get(vin, self._written_floor) > since:
+                self.stale_sets += 1
+                return
+            if ttl <= 0:
+                self._entries.pop(vin, None)
+                return
+            self._entries[vin] = (time.monotonic() + ttl, result)
+            self._entries.move_to_end(vin)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, vin):
+        """Drop a VIN after a failed or unknown write; counts as a write for set()"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._record_write(vin)
+            self._entries.pop(vin, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'miss_ttl': self.miss_ttl,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'stale_sets': self.stale_sets,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,208 @@
+from datetime import datetime, timedelta
+import hashlib
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    """Fixed-size Bloom filter over VIN strings
+
+    add() is serialized by a lock: setting a bit is a read-modify-write of its
+    byte, and request threads add VINs while the refresh thread does too. A
+    lost bit would make a stored VIN look definitely missing. Lookups only
+    read bits that are never cleared, so they take no lock.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.num_bits = max(int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        new = False
+        with self._lock:
+            for position in positions:
+                mask = 1 << (position & 7)
+                if not self.bits[position >> 3] & mask:
+                    self.bits[position >> 3] |= mask
+                    new = True
+            if new:
+                self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def memory_bytes(self):
+        return len(self.bits)
+
+    def estimated_false_positive_rate(self):
+        """Expected false-positive rate for the number of keys added so far"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+class VINIndex:
+    """In-memory membership index over vin_records.vin_value
+
+    A Bloom filter never reports a stored VIN as missing, so a negative answer
+    lets check_vin skip the database. VINs written by other workers become
+    visible after the next incremental refresh, which polls for records whose
+    scan_date/migrated_at moved past the last watermark.
+    """
+
+    def __init__(self, get_collection, error_rate=0.001, refresh_interval=10.0,
+                 rebuild_interval=3600.0, min_capacity=100000):
+        self.get_collection = get_collection
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.min_capacity = min_capacity
+        self._filter = None
+        self._watermark = None
+        self._last_rebuild = 0.0
+        # VINs add()ed while rebuild() scans the collection; the scan may
+        # already be past them, so they are replayed into the new filter
+        self._rebuild_adds = None
+        self._adds_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.loaded_at = None
+        self.load_seconds = None
+        self.definite_misses = 0
+        self.false_positives = 0
+        self.refresh_errors = 0
+
+    @property
+    def ready(self):
+        return self._filter is not None
+
+    def start(self):
+        """Load the index and keep it refreshed from a daemon thread"""
+        # A thread started before a fork does not exist in the child, so start another
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='vin-index-refresh', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if not self.ready or time.monotonic() - self._last_rebuild >= self.rebuild_interval:
+                    self.rebuild()
+                else:
+                    self.refresh()
+            except Exception as e:
+                self.refresh_errors += 1
+                logger.warning(f"VIN index refresh failed: {str(e)}")
+            self._stop.wait(self.refresh_interval)
+
+    def rebuild(self):
+        """Load every vin_value into a fresh filter sized for the collection"""
+        started = time.monotonic()
+        # Step the watermark back a little to absorb clock skew between writers
+        watermark = datetime.utcnow() - timedelta(seconds=30)
+        collection = self.get_collection()
+        capacity = max(collection.estimated_document_count() * 2, self.min_capacity)
+        bloom = BloomFilter(capacity, self.error_rate)
+
+        with self._adds_lock:
+            self._rebuild_adds = []
+        try:
+            cursor = collection.find({}, {'vin_value': 1, '_id': 0}).batch_size(10000)
+            for record in cursor:
+                if record.get('vin_value'):
+                    bloom.add(record['vin_value'])
+        except Exception:
+            with self._adds_lock:
+                self._rebuild_adds = None
+            raise
+
+        with self._adds_lock:
+            for vin in self._rebuild_adds:
+                bloom.add(vin)
+            self._rebuild_adds = None
+            self._filter = bloom
+        self._watermark = watermark
+        self._last_rebuild = time.monotonic()
+        self.loaded_at = datetime.utcnow()
+        self.load_seconds = round(self._last_rebuild - started, 3)
+        logger.info(f"VIN index loaded {bloom.count} VINs in {self.load_seconds}s "
+                    f"({bloom.memory_bytes} bytes)")
+
+    def refresh(self):
+        """Add VINs written since the last watermark"""
+        bloom = self._filter
+        watermark = datetime.utcnow() - timedelta(seconds=30)
+        cursor = self.get_collection().find(
+            {'$or': [
+                {'scan_date': {'$gt': self._watermark}},
+                {'migrated_at': {'$gt': self._watermark}}
+            ]},
+            {'vin_value': 1, '_id': 0}
+        )
+        added = 0
+        for record in cursor:
+            if record.get('vin_value'):
+                bloom.add(record['vin_value'])
+                added += 1
+        self._watermark = watermark
+        if added:
+            logger.info(f"VIN index refreshed with {added} recent VINs")
+        if bloom.count > bloom.capacity:
+            # Past capacity the false-positive rate climbs; rebuild on the next tick
+            self._last_rebuild = 0.0
+
+    def add(self, vin):
+        with self._adds_lock:
+            if self._rebuild_adds is not None:
+                self._rebuild_adds.append(vin)
+            bloom = self._filter
+        if bloom is not None:
+            bloom.add(vin)
+
+    def definitely_missing(self, vin):
+        """True only when the VIN is certainly not stored"""
+        bloom = self._filter
+        if bloom is None or vin in bloom:
+            return False
+        self.definite_misses += 1
+        return True
+
+    def record_false_positive(self):
+        """Called when the index said "maybe" but the database had no record"""
+        self.false_positives += 1
+
+    def stats(self):
+        bloom = self._filter
+        negatives = self.definite_misses + self.false_positives
+        return {
+            'ready': bloom is not None,
+            'vin_count': bloom.count if bloom else 0,
+            'capacity': bloom.capacity if bloom else 0,
+            'memory_bytes': bloom.memory_bytes if bloom else 0,
+            'num_hashes': bloom.num_hashes if bloom else 0,
+            'target_false_positive_rate': self.error_rate,
+            'estimated_false_positive_rate': round(bloom.estimated_false_positive_rate(), 6) if bloom else None,
+            'observed_false_positive_rate': round(self.false_positives / negatives, 6) if negatives else None,
+            'definite_misses': self.definite_misses,
+            'false_positives': self.false_positives,
+            'refresh_errors': self.refresh_errors,
+            'loaded_at': self.loaded_at.isoformat() if self.loaded_at else None,
+            'load_seconds': self.load_seconds
+        }
@@ -0,0 +1,55 @@
+import os
+import sqlite3
+from urllib.request import pathname2url
+from vin_snapshot import VINSnapshot
+
+# Local VIN membership checks for the desktop scanner (t.py).
+#
+# One long-lived read-only handle on either vin_database.db or a VIN
+# snapshot. Before each lookup the file's inode and mtime are compared with
+# the ones it was opened with; if the file was rebuilt or replaced (e.g. by
+# init_database.py or vin_snapshot.py) the handle is reopened transparently.
+# A LocalVINLookup is confined to one thread: t.py runs every lookup on a
+# single-thread executor.
+
+class LocalVINLookup:
+    # Constant SQL, so sqlite3's statement cache keeps it prepared
+    EXISTS_SQL = 'SELECT EXISTS(SELECT 1 FROM vin_records WHERE vin_value = ?)'
+
+    def __init__(self, db_path='vin_database.db', snapshot_path=None):
+        self.path = snapshot_path or db_path
+        self.kind = 'snapshot' if snapshot_path else 'sqlite'
+        self._handle = None
+        self._signature = None
+        self.reloads = 0
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _open(self):
+        if self.kind == 'snapshot':
+            return VINSnapshot(self.path)
+        uri = f"file:{pathname2url(os.path.abspath(self.path))}?mode=ro"
+        return sqlite3.connect(uri, uri=True, cached_statements=16)
+
+    def _current(self):
+        signature = self._file_signature()
+        if self._handle is not None and signature != self._signature:
+            self.close()
+            self.reloads += 1
+        if self._handle is None:
+            self._handle = self._open()
+            self._signature = signature
+        return self._handle
+
+    def exists(self, vin):
+        handle = self._current()
+        if self.kind == 'snapshot':
+            return vin in handle
+        return bool(handle.execute(self.EXISTS_SQL, (vin,)).fetchone()[0])
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
@@ -0,0 +1,123 @@
+import json
+
+# Request/response helpers shared by the Flask (app.py) and ASGI (asgi_app.py) APIs
+
+# Content types treated as newline-delimited JSON by the bulk ingest endpoint
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/jsonlines')
+
+class PayloadTooLarge(Exception):
+    """Bulk request body or record count over the configured limit (HTTP 413)"""
+    pass
+
+def collect_vins(query_vins, data):
+    """Collect VINs from repeated ?vin= params plus a JSON body ({"vins": [...]} or a list)
+
+    Blanks and duplicates are dropped while keeping the caller's order.
+    """
+    vins = list(query_vins)
+    if isinstance(data, dict) and isinstance(data.get('vins'), list):
+        vins.extend(data['vins'])
+    elif isinstance(data, list):
+        vins.extend(data)
+
+    seen = set()
+    unique_vins = []
+    for vin in vins:
+        if not isinstance(vin, str) or not vin or vin in seen:
+            continue
+        seen.add(vin)
+        unique_vins.append(vin)
+    return unique_vins
+
+def parse_ndjson_lines(lines, max_records=None):
+    """Parse NDJSON lines; invalid lines become the exception so item indexes still line up
+
+    Raises PayloadTooLarge as soon as there are more than max_records records.
+    """
+    records = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if max_records is not None and len(records) >= max_records:
+            raise PayloadTooLarge(f'At most {max_records} records per request')
+        try:
+            records.append(json.loads(line))
+        except ValueError as e:
+            records.append(e)
+    return records
+
+def bulk_records_from_json(data, max_records=None):
+    """Accept a JSON array of records, or {"records": [...]}"""
+    if isinstance(data, dict):
+        data = data.get('records')
+    if not isinstance(data, list):
+        return None
+    if max_records is not None and len(data) > max_records:
+        raise PayloadTooLarge(f'At most {max_records} records per request')
+    return data
+
+def check_body_size(content_length, max_bytes):
+    """Reject a body whose declared Content-Length is over max_bytes before reading it"""
+    if content_length is not None and int(content_length) > max_bytes:
+        raise PayloadTooLarge(f'Request body larger than {max_bytes} bytes')
+
+def merge_bulk_records(records):
+    """Merge duplicate VINs so each one reaches Mongo at most once
+
+    Later records win, but a later record without a description keeps the
+    earlier one. Returns the merged records in first-seen order, the per-item
+    errors for invalid input and the number of duplicates merged.
+    """
+    merged = {}
+    invalid = []
+    duplicates = 0
+    for index, record in enumerate(records):
+        if isinstance(record, Exception):
+            invalid.append({'index': index, 'status': 'error', 'error': f'Invalid JSON: {record}'})
+            continue
+        if not isinstance(record, dict) or not record.get('vin_value'):
+            invalid.append({'index': index, 'status': 'error', 'error': 'No VIN provided'})
+            continue
+
+        vin = str(record['vin_value'])
+        if vin in merged:
+            duplicates += 1
+            if record.get('description'):
+                merged[vin]['description'] = record['description']
+        else:
+            merged[vin] = {'vin_value': vin, 'description': record.get('description') or ''}
+    return list(merged.values()), invalid, duplicates
+
+def bulk_batch_results(batch, details):
+    """Per-item upserted/modified/error results for one bulk_write batch
+
+    details is BulkWriteResult.bulk_api_result, or BulkWriteError.details when
+    some of the unordered writes failed. Results line up with batch.
+    """
+    upserted = {item['index']: item['_id'] for item in details.get('upserted', [])}
+    failed = {item['index']: item.get('errmsg', 'Write failed') for item in details.get('writeErrors', [])}
+
+    results = []
+    for index, record in enumerate(batch):
+        if index in failed:
+            results.append({'vin_value': record['vin_value'], 'status': 'error', 'error': failed[index]})
+        elif index in upserted:
+            results.append({
+                'vin_value': record['vin_value'],
+                'status': 'upserted',
+                'upserted_id': str(upserted[index])
+            })
+        else:
+            results.append({'vin_value': record['vin_value'], 'status': 'modified'})
+    return results
+
+def lookup_result(record):
+    """check_vin response body for a vin_records document (or None)"""
+    if not record:
+        return {'found': False}
+    return {
+        'found': True,
+        'description': record.get('description'),
+        'scan_date': record.get('scan_date')
+    }
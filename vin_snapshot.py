@@ -0,0 +1,215 @@
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+import argparse
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+from vin_validation import VIN_LENGTH, normalize_vin
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Memory-mappable VIN snapshot for offline scanners.
+#
+# Layout (little-endian):
+#   header   HEADER struct, HEADER_SIZE bytes
+#   keys     count sorted VINs, KEY_WIDTH ASCII bytes each, no separators
+#   offsets  count + 1 uint64s into the description data (only if
+#            FLAG_DESCRIPTIONS is set); description i is data[off[i]:off[i+1]]
+#   data     UTF-8 descriptions, back to back
+#
+# Opening a snapshot reads the header and nothing else; lookups binary-search
+# the keys section straight out of the page cache.
+
+MAGIC = b'VINSNAP\x00'
+VERSION = 1
+KEY_WIDTH = VIN_LENGTH
+FLAG_DESCRIPTIONS = 1
+# magic, version, flags, key width, count, created (unix s), keys/offsets/data section offsets
+HEADER = struct.Struct('<8sHHIQQQQQ')
+HEADER_SIZE = 64
+OFFSET = struct.Struct('<Q')
+
+class SnapshotError(Exception):
+    pass
+
+class VINSnapshot:
+    """Read-only view of a snapshot file; safe to share between threads"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER_SIZE:
+            raise SnapshotError(f"{path} is too short to be a VIN snapshot")
+        (magic, version, self.flags, key_width, self.count, created,
+         self._keys_offset, self._offsets_offset, self._data_offset) = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a VIN snapshot")
+        if version != VERSION or key_width != KEY_WIDTH:
+            raise SnapshotError(f"{path} is snapshot version {version} with {key_width}-byte keys; "
+                                f"expected version {VERSION} with {KEY_WIDTH}-byte keys")
+        self.created_at = datetime.fromtimestamp(created, timezone.utc)
+        self.has_descriptions = bool(self.flags & FLAG_DESCRIPTIONS)
+
+    def __len__(self):
+        return self.count
+
+    def _index(self, vin):
+        """Position of vin in the keys section, or -1"""
+        key = normalize_vin(vin).encode('ascii', 'replace')
+        if len(key) != KEY_WIDTH:
+            return -1
+        mm = self._mm
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = self._keys_offset + middle * KEY_WIDTH
+            if mm[start:start + KEY_WIDTH] < key:
+                low = middle + 1
+            else:
+                high = middle
+        start = self._keys_offset + low * KEY_WIDTH
+        if low < self.count and mm[start:start + KEY_WIDTH] == key:
+            return low
+        return -1
+
+    def __contains__(self, vin):
+        return self._index(vin) >= 0
+
+    def description(self, index):
+        if not self.has_descriptions:
+            return None
+        start, = OFFSET.unpack_from(self._mm, self._offsets_offset + index * OFFSET.size)
+        end, = OFFSET.unpack_from(self._mm, self._offsets_offset + (index + 1) * OFFSET.size)
+        return self._mm[self._data_offset + start:self._data_offset + end].decode('utf-8')
+
+    def lookup(self, vin):
+        """Return (found, description); description is None without descriptions"""
+        index = self._index(vin)
+        if index < 0:
+            return False, None
+        return True, self.description(index)
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def write_snapshot(path, records, descriptions=True):
+    """Write (vin_value, description) records as a snapshot; returns the VIN count
+
+    Records may come in any order. VINs are normalized, values that are not
+    KEY_WIDTH ASCII characters are skipped and the first description of a
+    duplicate wins. Keys are sorted in memory (KEY_WIDTH bytes per VIN);
+    descriptions are spooled to a temporary file, so they never all sit in
+    memory. The file is written next to path and renamed into place.
+    """
+    keys = []
+    skipped = 0
+    with tempfile.TemporaryFile() as spool:
+        spool_offsets = []
+        for vin_value, description in records:
+            key = normalize_vin(vin_value).encode('ascii', 'replace')
+            if len(key) != KEY_WIDTH or b'?' in key:
+                skipped += 1
+                continue
+            keys.append(key)
+            if descriptions:
+                spool_offsets.append(spool.tell())
+                spool.write((description or '').encode('utf-8'))
+        spool_offsets.append(spool.tell())
+        if skipped:
+            logger.warning(f"Skipped {skipped} values that are not {KEY_WIDTH}-character VINs")
+
+        # Stable sort, then keep the first of each key
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        unique = [index for position, index in enumerate(order)
+                  if position == 0 or keys[index] != keys[order[position - 1]]]
+
+        count = len(unique)
+        keys_offset = HEADER_SIZE
+        offsets_offset = keys_offset + count * KEY_WIDTH
+        data_offset = offsets_offset + ((count + 1) * OFFSET.size if descriptions else 0)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as out:
+            try:
+                out.write(HEADER.pack(MAGIC, VERSION, FLAG_DESCRIPTIONS if descriptions else 0, KEY_WIDTH,
+                                      count, int(datetime.now(timezone.utc).timestamp()),
+                                      keys_offset, offsets_offset, data_offset).ljust(HEADER_SIZE, b'\0'))
+                for index in unique:
+                    out.write(keys[index])
+                if descriptions:
+                    position = 0
+                    for index in unique:
+                        out.write(OFFSET.pack(position))
+                        position += spool_offsets[index + 1] - spool_offsets[index]
+                    out.write(OFFSET.pack(position))
+                    for index in unique:
+                        spool.seek(spool_offsets[index])
+                        out.write(spool.read(spool_offsets[index + 1] - spool_offsets[index]))
+                out.flush()
+                os.fsync(out.fileno())
+            except BaseException:
+                os.unlink(out.name)
+                raise
+        # NamedTemporaryFile is private to its creator; scanners only need to read it
+        os.chmod(out.name, 0o644)
+        os.replace(out.name, path)
+    return count
+
+def sqlite_records(sqlite_path, batch_size=10000):
+    """Stream (vin_value, description) from vin_records"""
+    conn = sqlite3.connect(sqlite_path)
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT vin_value, description FROM vin_records')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+        conn.close()
+
+def mongo_records(collection, batch_size=10000):
+    """Stream (vin_value, description) from MongoDB with a projected find"""
+    for document in collection.find({}, {'_id': 0, 'vin_value': 1, 'description': 1}, batch_size=batch_size):
+        yield document.get('vin_value'), document.get('description')
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Export vin_records to a memory-mappable snapshot for offline scanners')
+    parser.add_argument('output', help='snapshot file to write, e.g. vins.snap')
+    parser.add_argument('--sqlite-path', default='vin_database.db')
+    parser.add_argument('--mongo', action='store_true', help='export from MongoDB (MONGO_URI) instead of SQLite')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI'))
+    parser.add_argument('--no-descriptions', action='store_true', help='keys only (smallest file)')
+    args = parser.parse_args()
+
+    if args.mongo:
+        if not args.mongo_uri:
+            parser.error('--mongo needs MONGO_URI or --mongo-uri')
+        from pymongo import MongoClient
+        import certifi
+        client = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=5000, tlsCAFile=certifi.where())
+        try:
+            count = write_snapshot(args.output, mongo_records(client.vin_database.vin_records),
+                                   not args.no_descriptions)
+        finally:
+            client.close()
+    else:
+        count = write_snapshot(args.output, sqlite_records(args.sqlite_path), not args.no_descriptions)
+    logger.info(f"Wrote {count} VINs to {args.output} ({os.path.getsize(args.output)} bytes)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import numpy as np
+
+# ISO 3779 VIN validation shared by the importer (init_database.py) and the
+# desktop scanner (t.py).
+#
+# A VIN is 17 characters from 0-9 and A-Z without I, O and Q. Position 9 is
+# the North American check digit and position 10 the model year code.
+# validate_vin() checks one value; validate_vins() checks a whole column with
+# NumPy array operations so bulk imports don't loop over rows in Python.
+
+VIN_LENGTH = 17
+VIN_CHARACTERS = '0123456789ABCDEFGHJKLMNPRSTUVWXYZ'
+
+# Rejection reasons, in the order they are checked
+EMPTY = 'empty'
+WRONG_LENGTH = 'wrong_length'
+INVALID_CHARACTERS = 'invalid_characters'
+BAD_MODEL_YEAR = 'bad_model_year'
+BAD_CHECK_DIGIT = 'bad_check_digit'
+
+TRANSLITERATION = {
+    **{str(digit): digit for digit in range(10)},
+    'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5, 'F': 6, 'G': 7, 'H': 8,
+    'J': 1, 'K': 2, 'L': 3, 'M': 4, 'N': 5, 'P': 7, 'R': 9,
+    'S': 2, 'T': 3, 'U': 4, 'V': 5, 'W': 6, 'X': 7, 'Y': 8, 'Z': 9
+}
+WEIGHTS = (8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2)
+
+# Position 10 codes in order from 1980; the cycle repeats every 30 years
+MODEL_YEAR_CODES = 'ABCDEFGHJKLMNPRSTVWXY123456789'
+MODEL_YEAR_BASE = 1980
+
+# Lookup tables indexed by ASCII code for the vectorized path
+_TRANSLITERATION_TABLE = np.zeros(256, dtype=np.int64)
+_VALID_TABLE = np.zeros(256, dtype=bool)
+_YEAR_TABLE = np.full(256, -1, dtype=np.int64)
+for _char, _value in TRANSLITERATION.items():
+    _TRANSLITERATION_TABLE[ord(_char)] = _value
+    _VALID_TABLE[ord(_char)] = True
+for _index, _char in enumerate(MODEL_YEAR_CODES):
+    _YEAR_TABLE[ord(_char)] = _index
+_WEIGHTS_ARRAY = np.array(WEIGHTS, dtype=np.int64)
+
+def normalize_vin(value):
+    """Upper-case and strip a scanned or imported value ('' for None)"""
+    return str(value).strip().upper() if value is not None else ''
+
+def compute_check_digit(vin):
+    """Expected position 9 character for a 17-character VIN: '0'-'9' or 'X'"""
+    total = sum(TRANSLITERATION[char] * weight for char, weight in zip(vin, WEIGHTS)) % 11
+    return 'X' if total == 10 else str(total)
+
+def decode_model_year(vin):
+    """Model year from position 10, or None if the code is not a year code
+
+    Position 7 tells the two 30-year cycles apart: a letter there means
+    2010-2039, a digit 1980-2009.
+    """
+    index = MODEL_YEAR_CODES.find(vin[9]) if len(vin) >= 10 else -1
+    if index < 0:
+        return None
+    return MODEL_YEAR_BASE + index + (30 if vin[6].isalpha() else 0)
+
+def validate_vin(value, check_digit=True):
+    """Normalize and validate one VIN; returns (vin, reason), reason None if valid
+
+    check_digit=False skips the position 9 check, which only North American
+    VINs are required to carry.
+    """
+    vin = normalize_vin(value)
+    if not vin:
+        return vin, EMPTY
+    if len(vin) != VIN_LENGTH:
+        return vin, WRONG_LENGTH
+    if any(char not in TRANSLITERATION for char in vin):
+        return vin, INVALID_CHARACTERS
+    if vin[9] not in MODEL_YEAR_CODES:
+        return vin, BAD_MODEL_YEAR
+    if check_digit and vin[8] != compute_check_digit(vin):
+        return vin, BAD_CHECK_DIGIT
+    return vin, None
+
+def is_valid_vin(value, check_digit=True):
+    return validate_vin(value, check_digit)[1] is None
+
+def validate_vins(values, check_digit=True):
+    """Validate a whole column of values at once
+
+    values is any sequence (list, NumPy array, pandas Series). Returns three
+    arrays of the same length: the normalized VINs, the rejection reason for
+    each row (None where valid) and the decoded model year (0 where it could
+    not be decoded).
+    """
+    values = ['' if value is None else value for value in values]
+    vins = np.char.upper(np.char.strip(np.asarray(values, dtype=str)))
+    count = len(vins)
+    reasons = np.full(count, None, dtype=object)
+    model_years = np.zeros(count, dtype=np.int64)
+    if not count:
+        return vins, reasons, model_years
+
+    lengths = np.char.str_len(vins)
+    reasons[lengths != VIN_LENGTH] = WRONG_LENGTH
+    reasons[lengths == 0] = EMPTY
+
+    rows = np.flatnonzero(lengths == VIN_LENGTH)
+    if len(rows):
+        # One uint8 row of ASCII codes per VIN; non-ASCII becomes '?', which is invalid
+        encoded = np.char.encode(vins[rows], 'ascii', 'replace').astype(f'S{VIN_LENGTH}')
+        codes = encoded.view(np.uint8).reshape(len(rows), VIN_LENGTH)
+
+        invalid = ~_VALID_TABLE[codes].all(axis=1)
+        year_index = _YEAR_TABLE[codes[:, 9]]
+        bad_year = ~invalid & (year_index < 0)
+        checked = ~invalid & ~bad_year
+        if check_digit:
+            totals = (_TRANSLITERATION_TABLE[codes] * _WEIGHTS_ARRAY).sum(axis=1) % 11
+            expected = np.where(totals == 10, ord('X'), ord('0') + totals)
+            bad_check = checked & (codes[:, 8] != expected)
+        else:
+            bad_check = np.zeros(len(rows), dtype=bool)
+
+        reasons[rows[invalid]] = INVALID_CHARACTERS
+        reasons[rows[bad_year]] = BAD_MODEL_YEAR
+        reasons[rows[bad_check]] = BAD_CHECK_DIGIT
+
+        # Letters sort after digits in ASCII, so >= 'A' marks the 2010-2039 cycle
+        decoded = ~invalid & ~bad_year
+        later_cycle = codes[:, 6] >= ord('A')
+        model_years[rows[decoded]] = (MODEL_YEAR_BASE + year_index + 30 * later_cycle)[decoded]
+
+    return vins, reasons, model_years